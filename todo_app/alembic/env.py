@@ -6,8 +6,9 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 from alembic import context
+from alembic.runtime.migration import MigrationContext
 
-import models
+from todo_app import models
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -29,6 +30,14 @@ target_metadata = models.Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+# alembic -x dry_run=true -x lock_timeout=5s upgrade head
+x_arguments = context.get_x_argument(as_dictionary=True)
+# print the SQL instead of running it, todo_app.migrations helpers only report
+dry_run = x_arguments.get("dry_run", "false").lower() in ("1", "true", "yes")
+# give up on DDL that would queue behind a long transaction, and every
+# write that queues behind it, rather than stall the app
+lock_timeout = x_arguments.get("lock_timeout", "5s")
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -68,7 +77,33 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql(f"SET lock_timeout = '{lock_timeout}'")
+            connection.commit()
+        if dry_run:
+            # like --sql from the revision the database is at: every statement
+            # is printed, none is run, so nothing is changed or locked. The
+            # helpers read the database through dry_run_connection to estimate.
+            heads = MigrationContext.configure(connection).get_current_heads()
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                as_sql=True,
+                starting_rev=list(heads) or None,
+                dry_run=True,
+                dry_run_connection=connection,
+            )
+            with context.begin_transaction():
+                context.run_migrations()
+            connection.rollback()
+            return
+
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # a failure leaves the revisions before it applied
+            transaction_per_migration=True,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,50 @@
+"""create tags
+
+Revision ID: 1d6b8e3f5a27
+Revises: e5a03b7c2f68
+Create Date: 2026-10-19 17:48:32.905514
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "1d6b8e3f5a27"
+down_revision: Union[str, None] = "e5a03b7c2f68"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tags",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("owner_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("name", sa.String, nullable=False),
+        sa.UniqueConstraint("owner_id", "name", name="uq_tags_owner_id_name"),
+    )
+    op.create_table(
+        "todo_tags",
+        sa.Column(
+            "todo_id",
+            sa.Integer,
+            sa.ForeignKey("todos.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column(
+            "tag_id",
+            sa.Integer,
+            sa.ForeignKey("tags.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+    )
+    op.create_index("ix_todo_tags_tag_id_todo_id", "todo_tags", ["tag_id", "todo_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_todo_tags_tag_id_todo_id", table_name="todo_tags")
+    op.drop_table("todo_tags")
+    op.drop_table("tags")
@@ -0,0 +1,71 @@
+"""add sync revisions to todos
+
+Revision ID: 3b9d1c7e4a20
+Revises: 05f2e06fd2f7
+Create Date: 2026-10-19 09:12:03.118402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9d1c7e4a20"
+down_revision: Union[str, None] = "05f2e06fd2f7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("todo_revision", sa.Integer, nullable=False, server_default="0"),
+    )
+    op.add_column("todos", sa.Column("updated_at", sa.DateTime, nullable=True))
+    op.add_column(
+        "todos",
+        sa.Column("revision", sa.Integer, nullable=False, server_default="0"),
+    )
+    # number existing todos 1..n per owner and leave each owner's counter at n,
+    # so the next write continues after them and delta clients see them all
+    op.execute("""
+        UPDATE todos
+        SET revision = numbered.revision, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY owner_id ORDER BY id)
+                AS revision
+            FROM todos
+        ) AS numbered
+        WHERE todos.id = numbered.id
+        """)
+    op.execute("""
+        UPDATE users
+        SET todo_revision = (
+            SELECT count(*) FROM todos WHERE todos.owner_id = users.id
+        )
+        """)
+    op.create_index("ix_todos_owner_id_revision", "todos", ["owner_id", "revision"])
+    op.create_table(
+        "todo_tombstones",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("todo_id", sa.Integer, nullable=False),
+        sa.Column("owner_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("revision", sa.Integer, nullable=False),
+        sa.Column("deleted_at", sa.DateTime, nullable=True),
+    )
+    op.create_index(
+        "ix_todo_tombstones_owner_id_revision",
+        "todo_tombstones",
+        ["owner_id", "revision"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_todo_tombstones_owner_id_revision", table_name="todo_tombstones")
+    op.drop_table("todo_tombstones")
+    op.drop_index("ix_todos_owner_id_revision", table_name="todos")
+    op.drop_column("todos", "revision")
+    op.drop_column("todos", "updated_at")
+    op.drop_column("users", "todo_revision")
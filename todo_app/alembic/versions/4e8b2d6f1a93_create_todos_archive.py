@@ -0,0 +1,49 @@
+"""create todos archive
+
+Revision ID: 4e8b2d6f1a93
+Revises: 9a7c4e2b6d31
+Create Date: 2026-10-19 18:40:51.203377
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "4e8b2d6f1a93"
+down_revision: Union[str, None] = "9a7c4e2b6d31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "todos_archive",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("todo_id", sa.Integer, nullable=False),
+        sa.Column("owner_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("task", sa.String),
+        sa.Column("description", sa.String),
+        sa.Column("priority", sa.Integer),
+        sa.Column("due_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime),
+        sa.Column("tags", sa.JSON, nullable=False),
+        sa.Column("archived_at", sa.DateTime, nullable=False),
+    )
+    op.create_index("ix_todos_archive_owner_id_id", "todos_archive", ["owner_id", "id"])
+    # partial, the archiver only ever scans completed todos
+    op.create_index(
+        "ix_todos_completed_updated_at",
+        "todos",
+        ["updated_at", "id"],
+        postgresql_where=sa.text("completed"),
+        sqlite_where=sa.text("completed"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_todos_completed_updated_at", table_name="todos")
+    op.drop_index("ix_todos_archive_owner_id_id", table_name="todos_archive")
+    op.drop_table("todos_archive")
@@ -0,0 +1,76 @@
+"""make todo description a string
+
+Revision ID: 7c2a9e4f1b58
+Revises: b3f9d1a7c6e2
+Create Date: 2026-10-19 20:05:37.418226
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from todo_app.migrations import backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2a9e4f1b58"
+down_revision: Union[str, None] = "b3f9d1a7c6e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sqlite keeps the strings it is given, only postgres needs the change
+    if op.get_context().dialect.name != "postgresql":
+        return
+    if not op.get_context().as_sql:
+        columns = sa.inspect(op.get_bind()).get_columns("todos")
+        if any(
+            column["name"] == "description" and isinstance(column["type"], sa.String)
+            for column in columns
+        ):
+            return
+
+    # ALTER COLUMN ... TYPE would rewrite todos under an exclusive lock, so
+    # fill a new column in batches instead and swap it in at the end. The
+    # backfill commits as it goes, so every step until the swap may already
+    # have run if the swap timed out on its lock last time.
+    op.execute("ALTER TABLE todos ADD COLUMN IF NOT EXISTS description_text VARCHAR")
+    # keeps the copy current for rows written while the backfill runs
+    op.execute("""
+        CREATE OR REPLACE FUNCTION todos_description_text() RETURNS trigger AS $$
+        BEGIN
+            NEW.description_text := NEW.description::varchar;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """)
+    op.execute("DROP TRIGGER IF EXISTS todos_description_text ON todos")
+    op.execute("""
+        CREATE TRIGGER todos_description_text BEFORE INSERT OR UPDATE ON todos
+        FOR EACH ROW EXECUTE FUNCTION todos_description_text()
+        """)
+    backfill(
+        "todos",
+        {"description_text": "description::varchar"},
+        where="description IS NOT NULL",
+    )
+    op.execute("DROP TRIGGER todos_description_text ON todos")
+    op.execute("DROP FUNCTION todos_description_text()")
+    op.drop_column("todos", "description")
+    op.alter_column("todos", "description_text", new_column_name="description")
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+    # rewrites the table, and descriptions that aren't numbers are lost
+    op.alter_column(
+        "todos",
+        "description",
+        type_=sa.Integer,
+        postgresql_using=(
+            "CASE WHEN description ~ '^-?[0-9]+$' THEN description::integer END"
+        ),
+    )
@@ -0,0 +1,43 @@
+"""create user todo stats
+
+Revision ID: 8f41a2d6c913
+Revises: 3b9d1c7e4a20
+Create Date: 2026-10-19 11:40:27.502113
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8f41a2d6c913"
+down_revision: Union[str, None] = "3b9d1c7e4a20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_todo_stats",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("priority", sa.Integer, primary_key=True),
+        sa.Column("open_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("completed_count", sa.Integer, nullable=False, server_default="0"),
+    )
+    # backfill from the existing todos, from here on the app keeps them current
+    op.execute("""
+        INSERT INTO user_todo_stats (user_id, priority, open_count, completed_count)
+        SELECT owner_id,
+               COALESCE(priority, 0),
+               SUM(CASE WHEN completed THEN 0 ELSE 1 END),
+               SUM(CASE WHEN completed THEN 1 ELSE 0 END)
+        FROM todos
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id, COALESCE(priority, 0)
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table("user_todo_stats")
@@ -0,0 +1,40 @@
+"""create users directory
+
+Revision ID: b3f9d1a7c6e2
+Revises: 4e8b2d6f1a93
+Create Date: 2026-10-19 19:26:14.570128
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b3f9d1a7c6e2"
+down_revision: Union[str, None] = "4e8b2d6f1a93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users_directory",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("email", sa.String, nullable=False, unique=True),
+    )
+    # every existing user keeps their id, new ids continue after the largest
+    op.execute(
+        "INSERT INTO users_directory (id, email) "
+        "SELECT id, email FROM users WHERE email IS NOT NULL"
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "SELECT setval(pg_get_serial_sequence('users_directory', 'id'), "
+            "(SELECT coalesce(max(id), 0) + 1 FROM users), false)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("users_directory")
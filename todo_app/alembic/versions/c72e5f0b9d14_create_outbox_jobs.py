@@ -0,0 +1,41 @@
+"""create outbox jobs
+
+Revision ID: c72e5f0b9d14
+Revises: 8f41a2d6c913
+Create Date: 2026-10-19 15:03:51.224870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c72e5f0b9d14"
+down_revision: Union[str, None] = "8f41a2d6c913"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox_jobs",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("kind", sa.String, nullable=False),
+        sa.Column("payload", sa.JSON, nullable=False),
+        sa.Column("status", sa.String, nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("run_after", sa.DateTime, nullable=False),
+        sa.Column("locked_at", sa.DateTime, nullable=True),
+        sa.Column("last_error", sa.String, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=True),
+    )
+    op.create_index(
+        "ix_outbox_jobs_status_run_after", "outbox_jobs", ["status", "run_after"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_jobs_status_run_after", table_name="outbox_jobs")
+    op.drop_table("outbox_jobs")
@@ -0,0 +1,37 @@
+"""add due and remind at to todos
+
+Revision ID: e5a03b7c2f68
+Revises: c72e5f0b9d14
+Create Date: 2026-10-19 16:21:09.671336
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e5a03b7c2f68"
+down_revision: Union[str, None] = "c72e5f0b9d14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("todos", sa.Column("due_at", sa.DateTime, nullable=True))
+    op.add_column("todos", sa.Column("remind_at", sa.DateTime, nullable=True))
+    # partial, so the millions of todos without a reminder stay out of it
+    op.create_index(
+        "ix_todos_remind_at",
+        "todos",
+        ["remind_at", "id"],
+        postgresql_where=sa.text("remind_at IS NOT NULL"),
+        sqlite_where=sa.text("remind_at IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_todos_remind_at", table_name="todos")
+    op.drop_column("todos", "remind_at")
+    op.drop_column("todos", "due_at")
@@ -0,0 +1,128 @@
+"""Moves completed todos out of the hot ``todos`` table.
+
+A todo that has been completed and unchanged for ``TODO_ARCHIVE_AFTER_DAYS``
+(30 by default) is copied to ``todos_archive`` and deleted from ``todos`` in
+the same transaction, ``batch_size`` rows at a time with a short pause in
+between, so the archiver never holds many locks or one long transaction. The
+delete goes through ``sync.record_delete`` like any other, so stats, caches,
+sync clients and open tabs all drop the todo. Completed todos written before
+``updated_at`` existed are stamped with the time the archiver first sees them
+and age from there. Archived todos are read back through /todos/archived,
+with their old id as ``todo_id``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+
+from . import events, jobs, sync
+from .models import Todo, TodoArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("TODO_ARCHIVE_AFTER_DAYS", "30"))
+
+
+class Archiver:
+    def __init__(
+        self,
+        session_factory,
+        after: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+        batch_size: int = 500,
+        pause: float = 0.1,
+        interval: timedelta = timedelta(hours=1),
+    ):
+        self.session_factory = session_factory
+        self.after = after
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+
+    def archive_batch(self, now: Optional[datetime] = None) -> int:
+        """Archive up to ``batch_size`` todos in one transaction."""
+        now = now or datetime.utcnow()
+        statement = (
+            select(Todo)
+            .where(Todo.completed.is_(True))
+            .where(Todo.updated_at < now - self.after)
+            .order_by(Todo.updated_at, Todo.id)
+            .limit(self.batch_size)
+            .options(selectinload(Todo.tags))
+        )
+        deleted = []
+        with self.session_factory() as db:
+            if db.get_bind().dialect.name == "postgresql":
+                # rows a user is editing right now are left for the next batch
+                statement = statement.with_for_update(skip_locked=True, of=Todo)
+            for todo in db.scalars(statement):
+                db.add(
+                    TodoArchive(
+                        todo_id=todo.id,
+                        owner_id=todo.owner_id,
+                        task=todo.task,
+                        description=todo.description,
+                        priority=todo.priority,
+                        due_at=todo.due_at,
+                        updated_at=todo.updated_at,
+                        tags=[tag.name for tag in todo.tags],
+                        archived_at=now,
+                    )
+                )
+                revision = sync.record_delete(db, todo)
+                deleted.append((todo.owner_id, todo.id, revision))
+                db.delete(todo)
+            db.commit()
+        for owner_id, todo_id, revision in deleted:
+            events.publish_delete(owner_id, todo_id, revision)
+        return len(deleted)
+
+    def stamp_undated(self, now: Optional[datetime] = None) -> int:
+        """Give completed todos without an ``updated_at`` one, so they age."""
+        with self.session_factory() as db:
+            stamped = db.execute(
+                update(Todo)
+                .where(Todo.completed.is_(True))
+                .where(Todo.updated_at.is_(None))
+                .values(updated_at=now or datetime.utcnow()),
+                execution_options={"synchronize_session": False},
+            ).rowcount
+            db.commit()
+        return stamped
+
+    def archive_all(self, now: Optional[datetime] = None) -> int:
+        """Archive batches until none is full, return the number archived."""
+        now = now or datetime.utcnow()
+        self.stamp_undated(now)
+        archived = 0
+        while True:
+            count = self.archive_batch(now)
+            archived += count
+            if count < self.batch_size:
+                return archived
+            time.sleep(self.pause)
+
+    async def run(self):
+        failures = 0
+        while True:
+            try:
+                await asyncio.to_thread(self.archive_all)
+                failures = 0
+            except Exception:
+                # e.g. a dropped connection, try again before the next interval
+                failures += 1
+                logger.exception("archiving failed")
+                await asyncio.sleep(
+                    min(jobs.retry_delay(failures), self.interval.total_seconds())
+                )
+                continue
+            await asyncio.sleep(self.interval.total_seconds())
+
+
+# one per shard
+archivers: list = []
@@ -0,0 +1,90 @@
+"""ORM vs Core read path for an owner's todo list.
+
+    python -m todo_app.benchmarks.read_path [rows]
+
+Loads ``rows`` todos for one owner into a temporary SQLite file, then times
+and measures peak Python memory for serializing them through the ORM query
+the handlers used to run and through ``queries.todos_for_owner``.
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from .. import queries
+from ..models import Base, Todo, User
+
+
+def orm_read(db, owner_id):
+    return jsonable_encoder(db.query(Todo).filter(Todo.owner_id == owner_id).all())
+
+
+def core_read(db, owner_id):
+    return jsonable_encoder(queries.todos_for_owner(db, owner_id))
+
+
+def measure(session_maker, read, owner_id, repeat=3):
+    # timed without tracemalloc, which slows allocation heavy code a lot
+    timings = []
+    for _ in range(repeat):
+        db = session_maker()
+        gc.collect()
+        started = time.process_time()
+        read(db, owner_id)
+        timings.append(time.process_time() - started)
+        db.close()
+
+    db = session_maker()
+    gc.collect()
+    tracemalloc.start()
+    result = read(db, owner_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.close()
+    del result
+    return min(timings), peak
+
+
+def main(rows: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"id": 1, "email": "bench@example.com"}])
+        connection.execute(
+            insert(Todo),
+            [
+                {
+                    "task": f"task {i}",
+                    "description": "benchmark",
+                    "priority": i % 5 + 1,
+                    "completed": i % 3 == 0,
+                    "owner_id": 1,
+                    "revision": i,
+                }
+                for i in range(rows)
+            ],
+        )
+    session_maker = sessionmaker(bind=engine)
+    orm_seconds, orm_peak = measure(session_maker, orm_read, 1)
+    core_seconds, core_peak = measure(session_maker, core_read, 1)
+    print(f"{rows} rows")
+    print(f"orm : {orm_seconds:.3f}s cpu, {orm_peak / 2**20:.1f} MiB peak")
+    print(f"core: {core_seconds:.3f}s cpu, {core_peak / 2**20:.1f} MiB peak")
+    print(
+        f"core uses {core_seconds / orm_seconds:.0%} of the cpu time and "
+        f"{core_peak / orm_peak:.0%} of the peak memory"
+    )
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,148 @@
+"""Endpoint latency as the data grows.
+
+    python -m todo_app.benchmarks.scale [--sizes 10000 100000 1000000]
+    python -m todo_app.benchmarks.scale --url postgresql://... [--user-id 1]
+
+For each size, seeds a temporary SQLite database with ``seed.generate``
+(one user per ``--todos-per-user`` todos). It then calls the list endpoints
+in-process as the heaviest user, who is an admin, and as a typical user, and
+prints the median and nearest-rank p95 latency of each, over at least
+``MIN_REPEAT`` calls. With ``--url`` it measures an existing database
+instead, e.g. one filled by ``seed`` on postgres.
+
+The routers are mounted on a bare app without the lifespan, so no background
+workers run and no middleware is involved. ``/`` is ``read_all``, which
+answers API clients with the todo list as it does in ``main.app``.
+"""
+
+import argparse
+import math
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import routers, sharding
+from ..cache import todo_cache
+from ..routers import admin, auth, todos
+from ..routers.auth import create_access_token
+from .seed import generate
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+# with fewer calls the p95 is just the slowest one
+MIN_REPEAT = 20
+ENDPOINTS = (
+    ("read_all", "/"),
+    ("home_page", "/home"),
+    ("admin all_users", "/admin/all_users"),
+    ("admin all_todos", "/admin/all_todos"),
+    ("admin users_by_load", "/admin/users_by_load"),
+)
+
+
+def make_client(engine, user_id: int):
+    session_maker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(routers.router)
+    # templates link to static files by route name
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+    for dependency in (
+        todos.get_db,
+        todos.get_read_db,
+        admin.get_db,
+        admin.get_read_db,
+    ):
+        app.dependency_overrides[dependency] = override_get_db
+    app.dependency_overrides[auth.get_current_user] = lambda: {
+        "username": f"user{user_id}",
+        "user_id": user_id,
+    }
+    client = TestClient(app)
+    # the HTML pages read the user from the cookie, not through the dependency
+    client.cookies.set(
+        "access_token", create_access_token(f"user{user_id}", user_id, timedelta(1))
+    )
+    return client
+
+
+def measure(client, path: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        todo_cache.clear()
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    timings.sort()
+    # nearest rank: the smallest timing at least 95% of the calls don't exceed
+    return statistics.median(timings), timings[math.ceil(0.95 * len(timings)) - 1]
+
+
+def report(engine, label: str, users: dict, repeat: int):
+    print(label)
+    # the admin listings query the shards directly
+    sharding.shards = sharding.ShardSet({"primary": engine})
+    for name, path in ENDPOINTS:
+        for who, user_id in users.items():
+            if name.startswith("admin") and who != "heaviest":
+                continue  # only the heaviest user is an admin
+            median, p95 = measure(make_client(engine, user_id), path, repeat)
+            print(
+                f"  {name:<20} {who:<8} "
+                f"p50 {median * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m todo_app.benchmarks.scale")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--todos-per-user", type=int, default=100)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=MIN_REPEAT,
+        help=f"calls per endpoint, at least {MIN_REPEAT} for a p95 to mean anything",
+    )
+    parser.add_argument("--url", help="measure this database instead of seeding")
+    parser.add_argument("--user-id", type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.repeat < MIN_REPEAT:
+        parser.error(f"--repeat must be at least {MIN_REPEAT}")
+
+    if args.url:
+        engine = create_engine(args.url)
+        report(engine, args.url, {"heaviest": args.user_id}, args.repeat)
+        engine.dispose()
+        return
+
+    for size in args.sizes:
+        users = max(size // args.todos_per_user, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'scale.db')}")
+            seconds = generate(engine, users, size)
+            label = f"{size} todos, {users} users (seeded in {seconds:.1f}s)"
+            # owners are skewed toward low ids, the median user is far lighter
+            typical = {"heaviest": 1, "typical": max(users // 2, 1)}
+            report(engine, label, typical, args.repeat)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
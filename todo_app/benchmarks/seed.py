@@ -0,0 +1,202 @@
+"""Bulk synthetic users and todos for local scale testing.
+
+    python -m todo_app.benchmarks.seed [--url URL] [--users N] [--todos N]
+
+Fills an empty database (the tables are created if missing) with ``--users``
+users and ``--todos`` todos. Owners are skewed, so a few users hold most of
+the todos, as they do in production. Completion, priority, due dates and
+last-change times are mixed. Every user gets the same bcrypt hash of
+``password``, computed once. The stats counters and per-user revisions are
+filled in to match, and every user has a directory entry, so every endpoint,
+login and registration included, sees consistent data.
+
+Rows go in through COPY on postgres and through executemany batches
+elsewhere. The same ``--seed`` always generates the same data.
+"""
+
+import argparse
+import csv
+import io
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, create_engine, insert, text, update
+
+from ..models import Base, Todo, User, UserDirectory, UserTodoStats
+from ..routers.auth import bcrypt_context
+
+PASSWORD = "password"
+TODO_FIELDS = (
+    "task",
+    "description",
+    "priority",
+    "completed",
+    "owner_id",
+    "updated_at",
+    "revision",
+    "due_at",
+)
+NOW = datetime(2026, 10, 19)
+
+
+def skewed_owner(rng: random.Random, users: int, skew: float) -> int:
+    # low ids are picked far more often, user 1 is the heaviest
+    return int(users * rng.random() ** skew) + 1
+
+
+class TodoGenerator:
+    """Todo rows, counting per-owner revisions and stats as they are made."""
+
+    def __init__(self, rng: random.Random, users: int, skew: float):
+        self.rng = rng
+        self.users = users
+        self.skew = skew
+        self.revisions = Counter()
+        # (owner_id, priority, completed) -> todos
+        self.stats = Counter()
+
+    def rows(self, todos: int):
+        rng = self.rng
+        for number in range(todos):
+            owner_id = skewed_owner(rng, self.users, self.skew)
+            self.revisions[owner_id] += 1
+            priority = rng.choices((1, 2, 3, 4, 5), weights=(10, 20, 40, 20, 10))[0]
+            completed = rng.random() < 0.4
+            self.stats[(owner_id, priority, completed)] += 1
+            updated_at = NOW - timedelta(minutes=rng.randrange(90 * 24 * 60))
+            due_at = updated_at + timedelta(days=rng.randrange(1, 30))
+            yield {
+                "task": f"task {number}",
+                "description": "generated",
+                "priority": priority,
+                "completed": completed,
+                "owner_id": owner_id,
+                "updated_at": updated_at,
+                "revision": self.revisions[owner_id],
+                "due_at": due_at if rng.random() < 0.2 else None,
+            }
+
+
+def batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(connection, table: str, fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[f] is None else row[f] for f in fields])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(fields)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def generate(
+    engine, users: int, todos: int, seed: int = 0, skew: float = 3, batch: int = 10000
+):
+    """Fill ``engine``'s database, return the seconds it took."""
+    started = time.perf_counter()
+    Base.metadata.create_all(bind=engine)
+    generator = TodoGenerator(random.Random(seed), users, skew)
+    hashed_password = bcrypt_context.hash(PASSWORD)
+    postgres = engine.dialect.name == "postgresql"
+
+    with engine.begin() as connection:
+        # users first, the todos reference them
+        user_rows = (
+            {
+                "id": user_id,
+                "email": f"user{user_id}@example.com",
+                "first_name": f"user{user_id}",
+                "last_name": "generated",
+                "hashed_password": hashed_password,
+                "is_active": True,
+                "role": "admin" if user_id == 1 else "user",
+            }
+            for user_id in range(1, users + 1)
+        )
+        for chunk in batches(user_rows, batch):
+            connection.execute(insert(User), chunk)
+            # login and registration look emails up in the directory
+            connection.execute(
+                insert(UserDirectory),
+                [{"id": row["id"], "email": row["email"]} for row in chunk],
+            )
+        if postgres:
+            # ids were given explicitly, move the sequences past them
+            for table in ("users", "users_directory"):
+                connection.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT max(id) FROM {table}))"
+                    )
+                )
+
+        for chunk in batches(generator.rows(todos), batch):
+            if postgres:
+                copy_rows(connection, "todos", TODO_FIELDS, chunk)
+            else:
+                connection.execute(insert(Todo), chunk)
+
+        # the counters are only known once every todo has been generated
+        revisions = (
+            {"user_id": owner_id, "revision": revision}
+            for owner_id, revision in sorted(generator.revisions.items())
+        )
+        set_revision = (
+            update(User)
+            .where(User.id == bindparam("user_id"))
+            .values(todo_revision=bindparam("revision"))
+        )
+        for chunk in batches(revisions, batch):
+            connection.execute(set_revision, chunk)
+
+        counts = generator.stats
+        keys = {(owner_id, priority) for owner_id, priority, _ in counts}
+        stats_rows = (
+            {
+                "user_id": owner_id,
+                "priority": priority,
+                "open_count": counts[(owner_id, priority, False)],
+                "completed_count": counts[(owner_id, priority, True)],
+            }
+            for owner_id, priority in sorted(keys)
+        )
+        for chunk in batches(stats_rows, batch):
+            connection.execute(insert(UserTodoStats), chunk)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m todo_app.benchmarks.seed")
+    parser.add_argument("--url", default="sqlite:///./seed.db")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--todos", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skew", type=float, default=3, help="higher puts more todos on few users"
+    )
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args(argv)
+    engine = create_engine(args.url)
+    seconds = generate(engine, args.users, args.todos, args.seed, args.skew, args.batch)
+    engine.dispose()
+    print(
+        f"{args.users} users, {args.todos} todos in {seconds:.1f}s "
+        f"({args.todos / seconds:,.0f} todos/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
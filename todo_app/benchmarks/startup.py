@@ -0,0 +1,66 @@
+"""Startup cost of a worker: imports, then the warm up steps.
+
+    python -m todo_app.benchmarks.startup [runs]
+
+Imports ``todo_app.main`` in fresh interpreters under ``python -X importtime``
+and reports the median total along with the packages that take longest. Then
+it runs ``warmup.warm_up`` against a temporary SQLite file, cold and a second
+time warm, to show what the first request would otherwise pay.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+
+def import_times(runs):
+    totals = []
+    packages = defaultdict(list)
+    for _ in range(runs):
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import todo_app.main"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        self_times = defaultdict(int)
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            if not self_us.strip().isdigit():
+                continue  # the header line
+            self_times[name.strip().split(".")[0]] += int(self_us)
+            if name.strip() == "todo_app.main":
+                totals.append(int(cumulative_us))
+        for package, micros in self_times.items():
+            packages[package].append(micros)
+    return totals, {name: statistics.median(times) for name, times in packages.items()}
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    totals, packages = import_times(runs)
+    print(f"import todo_app.main: {statistics.median(totals) / 1000:.1f} ms median")
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:12]
+    for name, micros in top:
+        print(f"  {name:<20} {micros / 1000:7.1f} ms")
+
+    from sqlalchemy import create_engine
+
+    from .. import warmup
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'startup.db')}")
+        for label in ("cold", "warm"):
+            timings = warmup.warm_up(engine)
+            steps = ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in timings.items())
+            print(f"warm_up {label}: {steps}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Python overhead of the per-request lookups, query chains vs lambdas.
+
+    python -m todo_app.benchmarks.statements [calls]
+
+Runs each lookup ``calls`` times against a tiny in-memory SQLite database,
+so nearly all of the time measured is spent in Python: building the
+statement, finding its compiled SQL in the cache, and loading the row. It
+then prints the microseconds per call for the statement the handlers used
+to build on every call and for the lambda statement in ``queries``.
+"""
+
+import gc
+import sys
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import selectinload, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .. import queries
+from ..models import Base, Tag, Todo, User, UserDirectory
+
+EMAIL = "bench@example.com"
+LOOKUPS = (
+    (
+        "todo by owner and id",
+        lambda db: db.query(Todo)
+        .filter(Todo.id == 1)
+        .filter(Todo.owner_id == 1)
+        .first(),
+        lambda db: queries.owned_todo(db, 1, 1),
+    ),
+    (
+        "todo with tags",
+        lambda db: db.query(Todo)
+        .options(selectinload(Todo.tags))
+        .filter(Todo.owner_id == 1)
+        .filter(Todo.id == 1)
+        .first(),
+        lambda db: queries.owned_todo(db, 1, 1, with_tags=True),
+    ),
+    (
+        "todos by owner",
+        lambda db: db.execute(
+            select(*queries.TODO_COLUMNS).where(Todo.owner_id == 1)
+        ).all(),
+        lambda db: queries.todo_rows_for_owner(db, 1),
+    ),
+    (
+        "user by id",
+        lambda db: db.query(User).filter(User.id == 1).first(),
+        lambda db: queries.user_by_id(db, 1),
+    ),
+    (
+        "user by email",
+        lambda db: db.query(UserDirectory).filter(UserDirectory.email == EMAIL).first(),
+        lambda db: queries.directory_entry(db, EMAIL),
+    ),
+)
+
+
+def per_call(session_maker, lookup, calls: int) -> float:
+    db = session_maker()
+    lookup(db)  # compile and cache before timing
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(calls):
+        lookup(db)
+        db.expunge_all()
+    elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed / calls
+
+
+def main(calls: int):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session_maker = sessionmaker(bind=engine)
+    with session_maker() as db:
+        db.add(UserDirectory(id=1, email=EMAIL))
+        db.add(User(id=1, email=EMAIL))
+        tag = Tag(owner_id=1, name="work")
+        db.add_all(Todo(owner_id=1, task=f"task {i}", tags=[tag]) for i in range(3))
+        db.commit()
+
+    print(f"{calls} calls each, microseconds per call")
+    for name, before, after in LOOKUPS:
+        chain = per_call(session_maker, before, calls) * 1e6
+        cached = per_call(session_maker, after, calls) * 1e6
+        print(
+            f"  {name:<22} chain {chain:7.1f}  lambda {cached:7.1f}  "
+            f"({cached / chain:.0%})"
+        )
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
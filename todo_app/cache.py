@@ -0,0 +1,179 @@
+"""Read-through cache for single todos, keyed by (owner_id, todo_id).
+
+Entries live in a small in-process LRU with a TTL. A shared store can sit
+behind it so workers warm each other; ``LocalStore`` is the stand-in used when
+no shared store is configured. Writers call ``invalidate_after_commit`` from
+the same places that bump the todo's revision, and the keys are dropped once
+the transaction commits. A read that loaded the row before an invalidation
+finished doesn't store it, and reads on a replica session never fill the
+cache, so a lagging replica can't put the old row back.
+
+Invalidation only reaches the process that made the write. With several
+workers and no shared store every worker would keep serving its own stale
+copies, so ``serve.py`` turns the cache off (``TODO_CACHE=off``) there.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import database, queries
+from .models import Todo
+
+CACHE_ENABLED = os.environ.get("TODO_CACHE", "on") != "off"
+
+
+class LocalStore:
+    """Dict with expiry, standing in for a shared store such as redis."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (None, 0))
+            if expires_at < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class TodoCache:
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 30,
+        shared=None,
+        shared_ttl: float = 300,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, a load that saw it change may have
+        # read the row from before the write and isn't stored
+        self._invalidations = 0
+
+    def get(
+        self,
+        owner_id: int,
+        todo_id: int,
+        load: Callable[[], Optional[dict]],
+        fill: bool = True,
+    ):
+        """Cached row, or ``load()``. Only stored when ``fill`` is set."""
+        if not self.enabled:
+            return load()
+        key = (owner_id, todo_id)
+        with self._lock:
+            invalidations = self._invalidations
+            value, expires_at = self._entries.get(key, (None, 0))
+            if value is not None and expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        if self.shared is not None:
+            value = self.shared.get(key)
+        if value is None:
+            value = load()
+            if value is None or not fill:
+                return value
+            if self.shared is not None:
+                with self._lock:
+                    if self._invalidations != invalidations:
+                        return value
+                self.shared.set(key, value, self.shared_ttl)
+        self._store(key, value, invalidations)
+        return value
+
+    def _store(self, key, value, invalidations: int):
+        with self._lock:
+            if self._invalidations != invalidations:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, owner_id: int, todo_id: int):
+        key = (owner_id, todo_id)
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+todo_cache = TodoCache(enabled=CACHE_ENABLED)
+
+
+def todo_to_dict(todo: Todo) -> dict:
+    return {
+        column.name: getattr(todo, column.name) for column in Todo.__table__.columns
+    }
+
+
+def get_todo(db: Session, owner_id: int, todo_id: int) -> Optional[dict]:
+    def load():
+        todo = queries.owned_todo(db, owner_id, todo_id, with_tags=True)
+        if todo is None:
+            return None
+        return {**todo_to_dict(todo), "tags": [tag.name for tag in todo.tags]}
+
+    # a replica may not have the latest write yet
+    on_replica = db.get_bind() in database.replicas.engines
+    return todo_cache.get(owner_id, todo_id, load, fill=not on_replica)
+
+
+def invalidate_after_commit(db: Session, owner_id: int, todo_id: Optional[int]):
+    if todo_id is not None:
+        db.info.setdefault("invalidate_todos", set()).add((owner_id, todo_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for owner_id, todo_id in session.info.pop("invalidate_todos", ()):
+        todo_cache.invalidate(owner_id, todo_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("invalidate_todos", None)
@@ -0,0 +1,153 @@
+"""In-process pub/sub of todo mutations, consumed by the SSE and WebSocket streams.
+
+Every worker keeps its own subscribers. When several workers run behind one
+database, ``start_pg_fanout`` relays events through postgres LISTEN/NOTIFY so a
+change made on one worker reaches tabs connected to another. Todo events carry
+only the id and revision, well under NOTIFY's 8000 byte limit, and
+subscribers fetch the rows they need.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from typing import Optional
+
+PG_CHANNEL = "todo_events"
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._fanout: Optional["PostgresFanout"] = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: int, event: dict):
+        if self._fanout is not None:
+            # every worker, this one included, delivers it when NOTIFY comes back
+            self._fanout.notify(user_id, event)
+        else:
+            self.deliver(user_id, event)
+
+    def deliver(self, user_id: int, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            # handlers may publish from the threadpool or another loop
+            loop.call_soon_threadsafe(_put_or_drop, queue, event)
+
+
+def _put_or_drop(queue: asyncio.Queue, event: dict):
+    # a stalled client shouldn't grow memory forever, it resyncs via /todos/changes
+    if not queue.full():
+        queue.put_nowait(event)
+
+
+bus = EventBus()
+
+
+def publish_todo(event_type: str, todo):
+    publish_todo_data(
+        event_type,
+        {"id": todo.id, "owner_id": todo.owner_id, "revision": todo.revision},
+    )
+
+
+def publish_todo_data(event_type: str, data: dict):
+    bus.publish(
+        data["owner_id"],
+        {"type": event_type, "id": data["id"], "revision": data["revision"]},
+    )
+
+
+def publish_delete(owner_id: int, todo_id: int, revision: int):
+    bus.publish(owner_id, {"type": "deleted", "revision": revision, "id": todo_id})
+
+
+class PostgresFanout:
+    """Relays events between workers over a postgres NOTIFY channel."""
+
+    def __init__(self, dsn: str, target: EventBus, channel: str = PG_CHANNEL):
+        import psycopg2
+
+        self.channel = channel
+        self.target = target
+        self._send = psycopg2.connect(dsn)
+        self._send.autocommit = True
+        self._send_lock = threading.Lock()
+        self._listen = psycopg2.connect(dsn)
+        self._listen.autocommit = True
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._sending = set()
+
+    def start(self):
+        with self._listen.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel};")
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+        self._listen.close()
+        self._send.close()
+
+    def notify(self, user_id: int, event: dict):
+        payload = json.dumps({"user_id": user_id, "event": event})
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._notify(payload)  # already off the event loop
+            return
+        # handlers publish after their commit, a slow or failed NOTIFY must
+        # neither block the loop nor turn the response into an error
+        task = loop.create_task(asyncio.to_thread(self._notify, payload))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    def _notify(self, payload: str):
+        try:
+            with self._send_lock, self._send.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s);", (self.channel, payload))
+        except Exception:
+            logger.exception("relaying an event to other workers failed")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if select.select([self._listen], [], [], 1.0) == ([], [], []):
+                continue
+            self._listen.poll()
+            while self._listen.notifies:
+                message = json.loads(self._listen.notifies.pop(0).payload)
+                self.target.deliver(message["user_id"], message["event"])
+
+
+def start_pg_fanout(dsn: str) -> PostgresFanout:
+    fanout = PostgresFanout(dsn, bus)
+    fanout.start()
+    bus._fanout = fanout
+    return fanout
+
+
+def stop_pg_fanout():
+    if bus._fanout is not None:
+        bus._fanout.stop()
+        bus._fanout = None
@@ -0,0 +1,76 @@
+"""Liveness and readiness probes.
+
+/healthz answers as long as the worker's event loop does. /readyz answers 200
+only once the lifespan has warmed the worker up and while the primary and
+every shard answer, so a load balancer sends no traffic to a worker that is
+still starting or has lost a database it writes to, and stops as soon as
+shutdown begins. A replica that is down or lagging only makes the worker
+"degraded": reads fall back to the primary, so it can still serve.
+"""
+
+import asyncio
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from . import database, sharding
+
+router = APIRouter(tags=["health"])
+
+# set by the lifespan
+ready = False
+
+
+def ping_database(engine):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def unavailable_databases() -> list:
+    """Names of the primary and shards that don't answer within 2 seconds."""
+    engines = {"primary": database.engine}
+    for name, engine in sharding.shards.engines.items():
+        if engine is not database.engine:
+            engines[f"shard {name}"] = engine
+
+    async def answers(engine) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.to_thread(ping_database, engine), 2)
+        except Exception:
+            return False
+        return True
+
+    results = await asyncio.gather(*(answers(e) for e in engines.values()))
+    return [name for name, ok in zip(engines, results) if not ok]
+
+
+def lagging_replicas() -> int:
+    """Replicas that don't answer or are further behind than allowed."""
+    replicas = database.replicas
+    lags = [replicas.lag(replica) for replica in replicas.engines]
+    return sum(lag is None or lag > replicas.max_lag_seconds for lag in lags)
+
+
+@router.get("/healthz")
+async def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readiness():
+    if not ready:
+        return JSONResponse(
+            {"status": "starting or stopping"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    unavailable = await unavailable_databases()
+    if unavailable:
+        return JSONResponse(
+            {"status": "database unavailable", "unavailable": unavailable},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    lagging = await asyncio.to_thread(lagging_replicas)
+    if lagging:
+        return {"status": "degraded", "replicas_unavailable": lagging}
+    return {"status": "ready"}
@@ -0,0 +1,210 @@
+"""Idempotency-Key support for the endpoints that create things.
+
+A POST to one of ``IDEMPOTENT_PATHS`` carrying an ``Idempotency-Key`` header
+claims that key, per user and path, before the handler runs. A retry with
+the same key gets the stored response back without running the handler
+again. A retry that arrives while the first request is still running gets a
+409. Keys expire after ``ttl``. A key reused with a different body gets a
+422. Server errors release the key so the client can try again. Signed-out
+requests, like registration, are scoped by client address and body as well,
+so strangers picking the same key never see each other's responses.
+"""
+
+import hashlib
+import itertools
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from .database import SessionLocal
+from .models import IdempotencyKey
+from .routers.auth import get_current_user
+
+IDEMPOTENT_PATHS = {
+    "/todo/create_todo",
+    "/add-todo",
+    "/auth/register",
+    "/auth/create_user",
+}
+HEADER = "idempotency-key"
+# response headers that belong to the original exchange only
+SKIPPED_HEADERS = {"content-length", "set-cookie"}
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        session_factory,
+        ttl: timedelta = timedelta(hours=24),
+        lease: timedelta = timedelta(seconds=60),
+        purge_every: int = 1000,
+    ):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        # a claim left by a request that never finished can be taken over after
+        self.lease = lease
+        self.purge_every = purge_every
+        self._claims = itertools.count(1)
+
+    def claim(self, scope: str, key: str, fingerprint: str):
+        """Return ("run", None), ("replay", record), ("busy"|"mismatch", None)."""
+        now = datetime.utcnow()
+        if next(self._claims) % self.purge_every == 0:
+            self.purge(now)
+        with self.session_factory() as db:
+            record = db.get(IdempotencyKey, (scope, key))
+            if record is not None:
+                taken_over = record.expires_at < now or (
+                    record.status_code is None and record.created_at < now - self.lease
+                )
+                if not taken_over:
+                    if record.fingerprint != fingerprint:
+                        return "mismatch", None
+                    if record.status_code is None:
+                        return "busy", None
+                    return "replay", record
+                db.delete(record)
+                db.flush()
+            db.add(
+                IdempotencyKey(
+                    scope=scope,
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + self.ttl,
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                # a concurrent retry claimed it first
+                return "busy", None
+        return "run", None
+
+    def complete(self, scope: str, key: str, status_code: int, headers, body: bytes):
+        with self.session_factory() as db:
+            record = db.get(IdempotencyKey, (scope, key))
+            if record is not None:
+                record.status_code = status_code
+                record.headers = headers
+                record.body = body
+                db.commit()
+
+    def release(self, scope: str, key: str):
+        with self.session_factory() as db:
+            db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope)
+                .where(IdempotencyKey.key == key)
+            )
+            db.commit()
+
+    def purge(self, now: datetime):
+        with self.session_factory() as db:
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+            db.commit()
+
+
+store = IdempotencyStore(SessionLocal)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in IDEMPOTENT_PATHS
+        ):
+            return await self.app(scope, receive, send)
+        key = Headers(scope=scope).get(HEADER)
+        if not key:
+            return await self.app(scope, receive, send)
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        try:
+            user = await get_current_user(Request(scope))
+        except Exception:
+            user = None
+        fingerprint = hashlib.sha256(body).hexdigest()
+        if user:
+            key_scope = f"{user['user_id']}:{scope['path']}"
+        else:
+            # nothing proves who an anonymous caller is, so their keys only
+            # match a retry of the very same request from the same address
+            host = scope["client"][0] if scope.get("client") else ""
+            key_scope = f"anonymous:{host}:{fingerprint}:{scope['path']}"
+
+        outcome, record = await run_in_threadpool(
+            store.claim, key_scope, key, fingerprint
+        )
+        if outcome == "busy":
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is in progress"},
+                status_code=409,
+            )
+            return await response(scope, receive, send)
+        if outcome == "mismatch":
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was used with a different request"},
+                status_code=422,
+            )
+            return await response(scope, receive, send)
+        if outcome == "replay":
+            response = Response(record.body, status_code=record.status_code)
+            for name, value in record.headers:
+                response.headers.append(name, value)
+            response.headers["Idempotent-Replayed"] = "true"
+            return await response(scope, receive, send)
+
+        sent_body = False
+
+        async def replay_body():
+            nonlocal sent_body
+            if sent_body:
+                return {"type": "http.disconnect"}
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        captured = {"status": 500, "headers": [], "body": b""}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [
+                    (name.decode("latin-1"), value.decode("latin-1"))
+                    for name, value in message.get("headers", [])
+                    if name.decode("latin-1").lower() not in SKIPPED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                captured["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except Exception:
+            await run_in_threadpool(store.release, key_scope, key)
+            raise
+        if captured["status"] >= 500:
+            await run_in_threadpool(store.release, key_scope, key)
+        else:
+            await run_in_threadpool(
+                store.complete,
+                key_scope,
+                key,
+                captured["status"],
+                captured["headers"],
+                captured["body"],
+            )
@@ -0,0 +1,222 @@
+"""Background jobs for side effects the user doesn't need to wait for.
+
+Handlers ``enqueue`` a job in the same session as the change that caused it,
+so the job is stored durably in ``outbox_jobs`` exactly when that change
+commits. ``JobWorker`` claims pending rows (``FOR UPDATE SKIP LOCKED`` on
+postgres, so several workers can share the table) and runs them on a small
+thread pool, retrying failures with backoff.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from . import stats
+from .models import OutboxJob
+
+logger = logging.getLogger(__name__)
+audit_logger = logging.getLogger("todo_app.audit")
+
+# a local stand-in such as ``python -m aiosmtpd -n -l localhost:1025`` works
+SMTP_HOST = os.environ.get("TODO_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("TODO_SMTP_PORT", "1025"))
+MAIL_FROM = os.environ.get("TODO_MAIL_FROM", "todo-app@localhost")
+
+handlers = {}
+
+
+def handler(kind: str):
+    def register(function: Callable[[Session, dict], None]):
+        handlers[kind] = function
+        return function
+
+    return register
+
+
+def enqueue(db: Session, kind: str, run_after: Optional[datetime] = None, **payload):
+    """Add a job to the session, it is stored when the session commits."""
+    db.add(
+        OutboxJob(kind=kind, payload=payload, run_after=run_after or datetime.utcnow())
+    )
+    db.info["jobs_enqueued"] = True
+
+
+@handler("send_email")
+def send_email(db: Session, payload: dict):
+    # only the job worker sends mail, web requests never need these
+    import smtplib
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = payload["to"]
+    message["Subject"] = payload["subject"]
+    message.set_content(payload["body"])
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp:
+        smtp.send_message(message)
+
+
+@handler("audit_log")
+def audit_log(db: Session, payload: dict):
+    audit_logger.info("%s user_id=%s", payload["action"], payload["user_id"])
+
+
+@handler("recompute_stats")
+def recompute_stats(db: Session, payload: dict):
+    stats.recompute(db, payload["user_id"])
+    db.commit()
+
+
+class JobWorker:
+    def __init__(
+        self,
+        session_factory,
+        concurrency: int = 4,
+        poll_interval: float = 5,
+        max_attempts: int = 5,
+        stale_after: timedelta = timedelta(minutes=10),
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def claim(self, limit: int) -> list:
+        now = datetime.utcnow()
+        due = (
+            select(OutboxJob.id)
+            .where(OutboxJob.status == "pending")
+            .where(OutboxJob.run_after <= now)
+            .order_by(OutboxJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        with self.session_factory() as db:
+            jobs = db.execute(
+                update(OutboxJob)
+                .where(OutboxJob.id.in_(due.scalar_subquery()))
+                .values(status="running", locked_at=now)
+                .returning(
+                    OutboxJob.id,
+                    OutboxJob.kind,
+                    OutboxJob.payload,
+                    OutboxJob.attempts,
+                ),
+                execution_options={"synchronize_session": False},
+            ).all()
+            db.commit()
+        return jobs
+
+    def run_job(self, job):
+        values = {"locked_at": None, "attempts": job.attempts + 1}
+        try:
+            with self.session_factory() as db:
+                handlers[job.kind](db, job.payload)
+            values["status"] = "done"
+        except Exception as error:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            values["last_error"] = repr(error)
+            if job.attempts + 1 >= self.max_attempts:
+                values["status"] = "failed"
+            else:
+                values["status"] = "pending"
+                backoff = timedelta(seconds=2 ** (job.attempts + 1))
+                values["run_after"] = datetime.utcnow() + backoff
+        with self.session_factory() as db:
+            db.execute(
+                update(OutboxJob).where(OutboxJob.id == job.id).values(**values),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+
+    def requeue_stale(self):
+        """Hand back jobs left running by a worker that died mid-job."""
+        with self.session_factory() as db:
+            db.execute(
+                update(OutboxJob)
+                .where(OutboxJob.status == "running")
+                .where(OutboxJob.locked_at < datetime.utcnow() - self.stale_after)
+                .values(status="pending", locked_at=None),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+
+    def run_pending(self) -> int:
+        """Run due jobs one after another until none are left, e.g. from scripts."""
+        done = 0
+        while jobs := self.claim(self.concurrency):
+            for job in jobs:
+                self.run_job(job)
+                done += 1
+        return done
+
+    def wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        running = set()
+        failures = 0
+
+        def finished(task):
+            running.discard(task)
+            self._wakeup.set()  # a slot is free again
+
+        try:
+            await asyncio.to_thread(self.requeue_stale)
+        except Exception:
+            logger.exception("requeueing stale jobs failed")
+        try:
+            while True:
+                self._wakeup.clear()
+                free = self.concurrency - len(running)
+                try:
+                    jobs = await asyncio.to_thread(self.claim, free) if free else []
+                    failures = 0
+                except Exception:
+                    # e.g. a dropped connection, keep the worker alive
+                    failures += 1
+                    logger.exception("claiming jobs failed")
+                    await asyncio.sleep(retry_delay(failures))
+                    continue
+                for job in jobs:
+                    task = asyncio.create_task(asyncio.to_thread(self.run_job, job))
+                    running.add(task)
+                    task.add_done_callback(finished)
+                if jobs and len(jobs) == free:
+                    continue  # there may be more due right now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # let claimed jobs finish so they aren't left running until stale
+            if running:
+                await asyncio.wait(running)
+            self._loop = None
+
+
+def retry_delay(failures: int, ceiling: float = 60) -> float:
+    """Seconds a background loop waits after ``failures`` errors in a row."""
+    return min(2 ** (failures - 1), ceiling)
+
+
+# one per shard, each working through its shard's outbox
+workers: list = []
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_worker(session):
+    if session.info.pop("jobs_enqueued", False):
+        for worker in workers:
+            worker.wake()
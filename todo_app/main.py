@@ -1,19 +1,117 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi import status
-from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
-from . import routers
+from . import (
+    archive,
+    events,
+    health,
+    jobs,
+    reminders,
+    routers,
+    sharding,
+    warmup,
+    writebehind,
+)
+from .idempotency import IdempotencyMiddleware
+from .database import (
+    PRIMARY_COOKIE,
+    PRIMARY_COOKIE_SECONDS,
+    SQLALCHEMY_DATABASE_URL,
+    engine,
+    replicas,
+    request_writes,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # serving starts only after this, so the first requests find open
+    # connections, compiled templates and a loaded bcrypt backend
+    await asyncio.to_thread(warmup.warm_up, engine, *sharding.shards.engines.values())
+    # with several workers, relay todo events between them through postgres
+    if os.environ.get("TODO_EVENTS_FANOUT") == "postgres":
+        events.start_pg_fanout(SQLALCHEMY_DATABASE_URL)
+    tasks = [
+        asyncio.create_task(buffer.run()) for buffer in writebehind.buffers.values()
+    ]
+    # each shard runs its own outbox, reminders and archiving
+    for name, session_factory in sharding.shards.session_factories().items():
+        worker = jobs.JobWorker(session_factory)
+        scheduler = reminders.ReminderScheduler(session_factory)
+        archiver = archive.Archiver(session_factory)
+        jobs.workers.append(worker)
+        reminders.schedulers[name] = scheduler
+        archive.archivers.append(archiver)
+        tasks += [
+            asyncio.create_task(worker.run()),
+            asyncio.create_task(scheduler.run()),
+            asyncio.create_task(archiver.run()),
+        ]
+    health.ready = True
+    yield
+    health.ready = False
+    try:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        archive.archivers.clear()
+        reminders.schedulers.clear()
+        jobs.workers.clear()
+        for buffer in writebehind.buffers.values():
+            # nothing buffered may be lost on a graceful shutdown
+            try:
+                buffer.flush()
+            except Exception:
+                logger.exception("final write-behind flush failed, toggles lost")
+    finally:
+        # connections go back whatever happened above
+        events.stop_pg_fanout()
+        replicas.dispose()
+        sharding.shards.dispose()
+        engine.dispose()
+
 
 # models.Base.metadata.create_all(bind=engine)
 # for first time creating database, with our class schema
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    # a client that just committed reads from the primary for a few seconds,
+    # so it doesn't see a replica that hasn't caught up with its own write
+    writes = {"committed": False}
+    token = request_writes.set(writes)
+    try:
+        response = await call_next(request)
+    finally:
+        request_writes.reset(token)
+    if writes["committed"]:
+        response.set_cookie(
+            key=PRIMARY_COOKIE,
+            value=str(time.time() + PRIMARY_COOKIE_SECONDS),
+            max_age=PRIMARY_COOKIE_SECONDS,
+            httponly=True,
+        )
+    return response
 
 
-@app.get("/", response_class=HTMLResponse)
-async def redirect_to_home_page(request: Request):
-    return RedirectResponse("/home", status_code=status.HTTP_302_FOUND)
+# retries of a create carrying an Idempotency-Key get the first response back
+app.add_middleware(IdempotencyMiddleware)
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount(
+    "/static",
+    StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")),
+    name="static",
+)
 
+app.include_router(health.router)
 app.include_router(routers.router)
@@ -0,0 +1,163 @@
+"""Helpers for migrations that run while the app keeps serving.
+
+A plain ``op.create_index`` or a single big UPDATE on ``todos`` blocks writes
+to the table for as long as it runs. The helpers here avoid that:
+
+- ``create_index_concurrently`` builds indexes with CREATE INDEX CONCURRENTLY
+  on postgres. That can't run in a transaction, so it runs in an autocommit
+  block. A valid index of that name is left alone. An invalid one, left by
+  a build that failed, is dropped and built again.
+- ``backfill`` updates rows in id ranges of ``batch_size``. Each range is
+  committed on its own, with a pause in between, and progress is logged.
+
+Migrations import them as ``from todo_app.migrations import backfill``. To
+see what an upgrade would do, run it with ``alembic -x dry_run=true upgrade
+head``. env.py then prints the SQL of every pending migration, as ``--sql``
+would, and runs none of it, so a dry run takes no locks beyond reads. The
+helpers only log how many rows they would touch. Postgres estimates come
+from the planner, so nothing gets scanned.
+"""
+
+import json
+import logging
+import time
+from typing import Optional
+
+import sqlalchemy as sa
+from alembic import op
+
+# under "alembic", so alembic.ini's logging config shows it
+log = logging.getLogger("alembic.online")
+
+
+def is_dry_run() -> bool:
+    return bool(op.get_context().opts.get("dry_run"))
+
+
+def estimate_rows(table: str, where: Optional[str] = None) -> int:
+    """Rows of ``table`` matching ``where``, the planner's guess on postgres."""
+    query = f"SELECT 1 FROM {table}" + (f" WHERE {where}" if where else "")
+    # a dry run has no real bind, env.py passes the connection separately
+    bind = op.get_context().opts.get("dry_run_connection") or op.get_bind()
+    if bind.dialect.name == "postgresql":
+        plan = bind.execute(sa.text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return bind.execute(sa.text(f"SELECT count(*) FROM ({query}) AS matched")).scalar()
+
+
+def index_is_valid(name: str, table: str) -> Optional[bool]:
+    """Whether postgres can use index ``name`` on ``table``, None if it's absent."""
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND i.indrelid = CAST(:table AS regclass)"
+            ),
+            {"name": name, "table": table},
+        )
+        .scalar()
+    )
+
+
+def create_index_concurrently(name: str, table: str, columns: list, **kw):
+    """``op.create_index`` without blocking writes to ``table`` on postgres."""
+    if is_dry_run():
+        log.info("would index ~%d rows of %s as %s", estimate_rows(table), table, name)
+        return
+    if op.get_context().dialect.name != "postgresql":
+        op.create_index(name, table, columns, **kw)
+        return
+    with op.get_context().autocommit_block():
+        previous = None
+        if op.get_context().as_sql:
+            # offline scripts can't look, and never set a lock_timeout
+            kw["if_not_exists"] = True
+        else:
+            valid = index_is_valid(name, table)
+            if valid:
+                log.info("index %s already exists, skipping", name)
+                return
+            if valid is not None:
+                # left invalid by a build that failed part way
+                op.execute(f"DROP INDEX CONCURRENTLY {name}")
+            previous = op.get_bind().exec_driver_sql("SHOW lock_timeout").scalar()
+        # the build waits for running transactions, which blocks nobody, then
+        # the timeout env.py set applies again
+        op.execute("SET lock_timeout = 0")
+        op.create_index(name, table, columns, postgresql_concurrently=True, **kw)
+        op.execute(
+            f"SET lock_timeout = '{previous}'" if previous else "RESET lock_timeout"
+        )
+
+
+def drop_index_concurrently(name: str, table: str):
+    if is_dry_run():
+        log.info("would drop index %s on %s", name, table)
+        return
+    if op.get_context().dialect.name != "postgresql":
+        op.drop_index(name, table_name=table)
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+
+def backfill(
+    table: str,
+    values: dict,
+    where: Optional[str] = None,
+    batch_size: int = 1000,
+    pause: float = 0.1,
+    report_every: float = 10,
+) -> int:
+    """``UPDATE table SET values WHERE where`` in committed id ranges.
+
+    ``values`` maps column names to SQL expressions. Returns the number of
+    rows updated."""
+    assignments = ", ".join(f"{column} = {value}" for column, value in values.items())
+    if is_dry_run():
+        log.info("would update ~%d rows of %s", estimate_rows(table, where), table)
+        return 0
+    if op.get_context().as_sql:
+        # offline scripts can't page, emit the whole update
+        op.execute(
+            f"UPDATE {table} SET {assignments}" + (f" WHERE {where}" if where else "")
+        )
+        return 0
+
+    expected = estimate_rows(table, where)
+    next_upper = sa.text(
+        f"SELECT max(id) FROM (SELECT id FROM {table} WHERE id > :last "
+        f"ORDER BY id LIMIT :size) AS batch"
+    )
+    update = sa.text(
+        f"UPDATE {table} SET {assignments} WHERE id > :last AND id <= :upper"
+        + (f" AND ({where})" if where else "")
+    )
+    updated, last = 0, 0
+    started = reported = time.monotonic()
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            upper = bind.execute(
+                next_upper, {"last": last, "size": batch_size}
+            ).scalar()
+            if upper is None:
+                break
+            updated += bind.execute(update, {"last": last, "upper": upper}).rowcount
+            last = upper
+            if time.monotonic() - reported >= report_every:
+                reported = time.monotonic()
+                log.info(
+                    "%s: %d of ~%d rows, %.0f rows/s",
+                    table,
+                    updated,
+                    expected,
+                    updated / (reported - started),
+                )
+            time.sleep(pause)
+    log.info("%s: updated %d rows in %.1fs", table, updated, time.monotonic() - started)
+    return updated
@@ -2,7 +2,23 @@ import sys
 
 sys.path.append(".")
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    UniqueConstraint,
+    text,
+)
+from sqlalchemy.orm import relationship
 from .database import Base
 
 
@@ -15,13 +31,146 @@ class User(Base):
     last_name = Column(String)
     is_active = Column(Boolean, default=1)
     role = Column(String)
+    # last revision handed out to this user's todos, see sync.next_revision
+    todo_revision = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class UserDirectory(Base):
+    # hands out user ids and maps emails to them, on the primary database
+    # even when users themselves live on shards (see sharding.py)
+    __tablename__ = "users_directory"
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, nullable=False)
 
 
 class Todo(Base):
     __tablename__ = "todos"
     id = Column(Integer, primary_key=True, index=True)
     task = Column(String)
-    description = Column(Integer)
+    description = Column(String)
     priority = Column(Integer)
     completed = Column(Boolean, default=0)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    revision = Column(Integer, default=0, server_default="0", nullable=False)
+    due_at = Column(DateTime)
+    # cleared by the reminder scheduler once the reminder has been sent
+    remind_at = Column(DateTime)
+    tags = relationship("Tag", secondary="todo_tags", order_by="Tag.name")
+
+    __table_args__ = (
+        Index("ix_todos_owner_id_revision", "owner_id", "revision"),
+        Index(
+            "ix_todos_remind_at",
+            "remind_at",
+            "id",
+            postgresql_where=text("remind_at IS NOT NULL"),
+            sqlite_where=text("remind_at IS NOT NULL"),
+        ),
+        # the archiver's scan for completed todos that haven't changed in a while
+        Index(
+            "ix_todos_completed_updated_at",
+            "updated_at",
+            "id",
+            postgresql_where=text("completed"),
+            sqlite_where=text("completed"),
+        ),
+    )
+
+
+todo_tags = Table(
+    "todo_tags",
+    Base.metadata,
+    Column(
+        "todo_id", Integer, ForeignKey("todos.id", ondelete="CASCADE"), primary_key=True
+    ),
+    Column(
+        "tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    ),
+    # the primary key serves todo -> tags, this one tag -> todos for filtering
+    Index("ix_todo_tags_tag_id_todo_id", "tag_id", "todo_id"),
+)
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "name", name="uq_tags_owner_id_name"),
+    )
+
+
+class TodoArchive(Base):
+    # completed todos moved out of the hot table by the archiver
+    __tablename__ = "todos_archive"
+    id = Column(Integer, primary_key=True)
+    # its id in todos, which a later todo may be given again
+    todo_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    task = Column(String)
+    description = Column(String)
+    priority = Column(Integer)
+    due_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    tags = Column(JSON, nullable=False, default=list)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_todos_archive_owner_id_id", "owner_id", "id"),)
+
+
+class TodoTombstone(Base):
+    # left behind by deleted todos so sync clients can drop their local copy
+    __tablename__ = "todo_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    todo_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_todo_tombstones_owner_id_revision", "owner_id", "revision"),
+    )
+
+
+class UserTodoStats(Base):
+    # one row per (user, priority), kept current by stats.py on every write
+    __tablename__ = "user_todo_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    priority = Column(Integer, primary_key=True)
+    open_count = Column(Integer, default=0, server_default="0", nullable=False)
+    completed_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class OutboxJob(Base):
+    # deferred side effects, written in the same transaction as the change
+    # that caused them and picked up by jobs.JobWorker
+    __tablename__ = "outbox_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, default="pending", server_default="pending", nullable=False)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = Column(DateTime)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_outbox_jobs_status_run_after", "status", "run_after"),)
+
+
+class IdempotencyKey(Base):
+    # response of a request sent with an Idempotency-Key header, replayed to
+    # retries of the same request until it expires
+    __tablename__ = "idempotency_keys"
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    # null while the first request is still running
+    status_code = Column(Integer)
+    headers = Column(JSON)
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,180 @@
+"""Read-only queries for the list endpoints.
+
+These use Core ``select()`` on just the columns the handlers serialize or
+render, so no ORM instances, identity map entries or change tracking are set
+up for rows that are only going to be read. ``hashed_password`` is never
+selected. Tags for a page of todos are fetched with one extra ``IN`` query,
+the same batching ``selectinload`` does, instead of one query per todo.
+
+The owner-scoped lookups that run on nearly every request are lambda
+statements. SQLAlchemy builds each one and computes its cache key once, per
+call site, and after that only binds the new ids. A ``select()`` or
+``db.query()`` chain is rebuilt and re-keyed on every call before the cached
+SQL can be found.
+"""
+
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import func, lambda_stmt, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+
+from .models import Tag, Todo, TodoArchive, User, UserDirectory, todo_tags
+
+TODO_COLUMNS = (
+    Todo.id,
+    Todo.task,
+    Todo.description,
+    Todo.priority,
+    Todo.completed,
+    Todo.owner_id,
+    Todo.updated_at,
+    Todo.revision,
+    Todo.due_at,
+    Todo.remind_at,
+)
+
+ARCHIVE_COLUMNS = (
+    TodoArchive.id,
+    TodoArchive.todo_id,
+    TodoArchive.task,
+    TodoArchive.description,
+    TodoArchive.priority,
+    TodoArchive.owner_id,
+    TodoArchive.due_at,
+    TodoArchive.updated_at,
+    TodoArchive.tags,
+    TodoArchive.archived_at,
+)
+
+USER_COLUMNS = (
+    User.id,
+    User.email,
+    User.first_name,
+    User.last_name,
+    User.is_active,
+    User.role,
+)
+
+
+def owned_todo(
+    db: Session, owner_id: int, todo_id: int, with_tags: bool = False
+) -> Optional[Todo]:
+    """The owner's todo for updating, None if it isn't theirs."""
+    statement = lambda_stmt(
+        lambda: select(Todo).where(Todo.owner_id == owner_id, Todo.id == todo_id)
+    )
+    if with_tags:
+        statement += lambda s: s.options(selectinload(Todo.tags))
+    return db.scalars(statement).first()
+
+
+def user_by_id(db: Session, user_id: int) -> Optional[User]:
+    return db.scalars(
+        lambda_stmt(lambda: select(User).where(User.id == user_id))
+    ).first()
+
+
+def directory_entry(db: Session, email: str) -> Optional[UserDirectory]:
+    """The directory entry for an email, which has the user's id."""
+    statement = lambda_stmt(
+        lambda: select(UserDirectory).where(UserDirectory.email == email)
+    )
+    return db.scalars(statement).first()
+
+
+def _owner_todos(owner_id: int):
+    return lambda_stmt(lambda: select(*TODO_COLUMNS).where(Todo.owner_id == owner_id))
+
+
+def todo_rows_for_owner(db: Session, owner_id: int):
+    """Rows with attribute access, for templates."""
+    return db.execute(_owner_todos(owner_id)).all()
+
+
+def todos_for_owner(
+    db: Session, owner_id: int, tags: Optional[list] = None, match_all: bool = False
+):
+    if tags:
+        # varies with the tags, so not worth caching as a lambda
+        statement = (
+            select(*TODO_COLUMNS)
+            .where(Todo.owner_id == owner_id)
+            .where(Todo.id.in_(tagged_todo_ids(owner_id, tags, match_all)))
+        )
+    else:
+        statement = _owner_todos(owner_id)
+    todos = [dict(row) for row in db.execute(statement).mappings()]
+    return with_tag_names(db, todos)
+
+
+def tag_names(tags: list) -> list:
+    """``tags`` as stored: stripped, lower case, each once."""
+    return sorted({name.strip().lower() for name in tags})
+
+
+def tagged_todo_ids(owner_id: int, tags: list, match_all: bool):
+    """Subquery of the owner's todo ids carrying any (or all) of ``tags``."""
+    names = tag_names(tags)
+    statement = (
+        select(todo_tags.c.todo_id)
+        .join(Tag, Tag.id == todo_tags.c.tag_id)
+        .where(Tag.owner_id == owner_id)
+        .where(Tag.name.in_(names))
+    )
+    if match_all:
+        statement = statement.group_by(todo_tags.c.todo_id).having(
+            func.count(todo_tags.c.tag_id) == len(names)
+        )
+    return statement
+
+
+def with_tag_names(db: Session, todos: list):
+    if not todos:
+        return todos
+    names = defaultdict(list)
+    rows = db.execute(
+        select(todo_tags.c.todo_id, Tag.name)
+        .join(Tag, Tag.id == todo_tags.c.tag_id)
+        .where(todo_tags.c.todo_id.in_([todo["id"] for todo in todos]))
+        .order_by(Tag.name)
+    )
+    for todo_id, name in rows:
+        names[todo_id].append(name)
+    for todo in todos:
+        todo["tags"] = names[todo["id"]]
+    return todos
+
+
+def all_todos(db: Session, after: tuple = (0, 0), limit: Optional[int] = None):
+    """Todos ordered by (owner_id, id), starting after the ``after`` pair."""
+    statement = (
+        select(*TODO_COLUMNS)
+        .where(tuple_(Todo.owner_id, Todo.id) > tuple_(*after))
+        .order_by(Todo.owner_id, Todo.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in db.execute(statement).mappings()]
+
+
+def all_users(db: Session, after_id: int = 0, limit: Optional[int] = None):
+    statement = (
+        select(*USER_COLUMNS).where(User.id > after_id).order_by(User.id).limit(limit)
+    )
+    return [dict(row) for row in db.execute(statement).mappings()]
+
+
+def todos_by_ids(db: Session, todo_ids: list):
+    result = db.execute(select(*TODO_COLUMNS).where(Todo.id.in_(todo_ids)))
+    return [dict(row) for row in result.mappings()]
+
+
+def archived_for_owner(
+    db: Session, owner_id: int, before: Optional[int] = None, limit: int = 50
+):
+    """A page of archived todos, newest id first, starting below ``before``."""
+    statement = select(*ARCHIVE_COLUMNS).where(TodoArchive.owner_id == owner_id)
+    if before is not None:
+        statement = statement.where(TodoArchive.id < before)
+    statement = statement.order_by(TodoArchive.id.desc()).limit(limit)
+    return [dict(row) for row in db.execute(statement).mappings()]
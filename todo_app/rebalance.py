@@ -0,0 +1,211 @@
+"""Move users to the shard the hash ring puts them on.
+
+    python -m todo_app.rebalance [--dry-run] [--drain name=url ...]
+
+Run this after changing ``TODO_SHARD_URLS``, while the app is stopped or
+with the moving users' writes paused. It finds every user who hashes
+somewhere else, plus everyone on the shards passed with ``--drain`` that are
+being removed. Each user moves with everything they own, outbox jobs about
+them included, in two steps: a copy
+committed on the target, then a delete committed on the source. The source
+stays authoritative until the delete. If a run dies halfway, run it again:
+it replaces any partial copy it finds on the target.
+
+Todo, tag and archive ids are per shard, so moved rows get new ids on the
+target. Moved todos get new revisions and their old ids are tombstoned, so
+sync clients drop the old copies and pick up the new ones on their next
+/todos/changes.
+"""
+
+import argparse
+from collections import Counter
+
+from sqlalchemy import create_engine, delete, insert, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from . import sharding
+from .models import (
+    OutboxJob,
+    Tag,
+    Todo,
+    TodoArchive,
+    TodoTombstone,
+    User,
+    UserTodoStats,
+    todo_tags,
+)
+
+
+def misplaced_users(name: str, engine: Engine, shards, batch: int = 1000):
+    """Yield (user_id, target shard) for users on ``name`` that belong elsewhere."""
+    last_id = 0
+    while True:
+        with engine.connect() as connection:
+            ids = connection.scalars(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch)
+            ).all()
+        if not ids:
+            return
+        for user_id in ids:
+            target = shards.name_for(user_id)
+            if target != name:
+                yield user_id, target
+        last_id = ids[-1]
+
+
+def owned_jobs(user_id: int):
+    """Outbox jobs about ``user_id``, which have to run on the user's shard."""
+    return or_(
+        OutboxJob.payload["user_id"].as_integer() == user_id,
+        OutboxJob.payload["owner_id"].as_integer() == user_id,
+    )
+
+
+def delete_owner(connection: Connection, user_id: int):
+    owned_todos = select(Todo.id).where(Todo.owner_id == user_id)
+    connection.execute(delete(todo_tags).where(todo_tags.c.todo_id.in_(owned_todos)))
+    connection.execute(delete(OutboxJob).where(owned_jobs(user_id)))
+    for model, column in (
+        (Todo, Todo.owner_id),
+        (Tag, Tag.owner_id),
+        (TodoTombstone, TodoTombstone.owner_id),
+        (UserTodoStats, UserTodoStats.user_id),
+        (TodoArchive, TodoArchive.owner_id),
+        (User, User.id),
+    ):
+        connection.execute(delete(model).where(column == user_id))
+
+
+def _rows(connection: Connection, model, column, user_id: int) -> list:
+    statement = select(model.__table__).where(column == user_id)
+    return [dict(row) for row in connection.execute(statement).mappings()]
+
+
+def _without_id(row: dict) -> dict:
+    return {column: value for column, value in row.items() if column != "id"}
+
+
+def _insert(connection: Connection, model, values: dict) -> int:
+    return connection.execute(insert(model), values).inserted_primary_key[0]
+
+
+def move_user(source: Engine, target: Engine, user_id: int) -> int:
+    """Copy a user and everything they own to ``target``, then delete it from
+    ``source``. Returns the number of todos moved."""
+    with source.connect() as connection:
+        user = _rows(connection, User, User.id, user_id)[0]
+        tags = _rows(connection, Tag, Tag.owner_id, user_id)
+        todos = sorted(
+            _rows(connection, Todo, Todo.owner_id, user_id), key=lambda t: t["id"]
+        )
+        links = connection.execute(
+            select(todo_tags).where(
+                todo_tags.c.todo_id.in_(select(Todo.id).where(Todo.owner_id == user_id))
+            )
+        ).all()
+        tombstones = _rows(connection, TodoTombstone, TodoTombstone.owner_id, user_id)
+        stats = _rows(connection, UserTodoStats, UserTodoStats.user_id, user_id)
+        archived = _rows(connection, TodoArchive, TodoArchive.owner_id, user_id)
+        outbox = [
+            dict(row)
+            for row in connection.execute(
+                select(OutboxJob.__table__).where(owned_jobs(user_id))
+            ).mappings()
+        ]
+
+    with target.begin() as connection:
+        delete_owner(connection, user_id)  # left by an interrupted run
+        connection.execute(insert(User), [user])
+        tag_ids = {
+            tag["id"]: _insert(connection, Tag, _without_id(tag)) for tag in tags
+        }
+        revision = user["todo_revision"]
+        todo_ids = {}
+        for todo in todos:
+            revision += 1
+            todo_ids[todo["id"]] = _insert(
+                connection, Todo, {**_without_id(todo), "revision": revision}
+            )
+        if links:
+            connection.execute(
+                insert(todo_tags),
+                [
+                    {"todo_id": todo_ids[todo_id], "tag_id": tag_ids[tag_id]}
+                    for todo_id, tag_id in links
+                ],
+            )
+        # tell sync clients the old ids are gone, unless a new todo took one
+        gone = sorted(set(todo_ids) - set(todo_ids.values()))
+        for tombstone in tombstones:
+            connection.execute(insert(TodoTombstone), [_without_id(tombstone)])
+        for old_id in gone:
+            revision += 1
+            connection.execute(
+                insert(TodoTombstone),
+                [{"todo_id": old_id, "owner_id": user_id, "revision": revision}],
+            )
+        if stats:
+            connection.execute(insert(UserTodoStats), stats)
+        if archived:
+            connection.execute(
+                insert(TodoArchive), [_without_id(row) for row in archived]
+            )
+        for job in outbox:
+            # a reminder still names the todo's old id
+            payload = job["payload"]
+            if "todo_id" in payload:
+                payload = {
+                    **payload,
+                    "todo_id": todo_ids.get(payload["todo_id"], payload["todo_id"]),
+                }
+            connection.execute(
+                insert(OutboxJob), [{**_without_id(job), "payload": payload}]
+            )
+        connection.execute(
+            update(User).where(User.id == user_id).values(todo_revision=revision)
+        )
+
+    with source.begin() as connection:
+        delete_owner(connection, user_id)
+    return len(todos)
+
+
+def rebalance(shards, drain: dict = None, dry_run: bool = False) -> Counter:
+    """Move every misplaced user, return how many moved per (source, target).
+
+    ``drain`` shards are not on the ring, so every user on them moves."""
+    sources = {**shards.engines, **(drain or {})}
+    moved = Counter()
+    for name, engine in sources.items():
+        for user_id, target in list(misplaced_users(name, engine, shards)):
+            if not dry_run:
+                move_user(engine, shards.engines[target], user_id)
+            moved[(name, target)] += 1
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m todo_app.rebalance")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--drain",
+        action="append",
+        default=[],
+        help="name=url of a shard being removed, every user on it moves",
+    )
+    args = parser.parse_args(argv)
+    drain = {
+        name: create_engine(url)
+        for name, url in sharding.parse_shard_urls(",".join(args.drain)).items()
+    }
+    moved = rebalance(sharding.shards, drain, args.dry_run)
+    verb = "would move" if args.dry_run else "moved"
+    for (source, target), users in sorted(moved.items()):
+        print(f"{source} -> {target}: {verb} {users} users")
+    print(f"{verb} {sum(moved.values())} users in total")
+    for engine in drain.values():
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Reminder scheduler for todos with a ``remind_at``.
+
+The scheduler never polls the whole table. It keeps the reminders due in the
+next ``lookahead`` in a min-heap and refills it with keyset range scans over
+the partial ``ix_todos_remind_at`` index, at most ``max_heap`` rows at a
+time, so memory stays bounded however many reminders are pending. Handlers
+call ``schedule`` after committing a todo whose reminder falls inside the
+window that's already loaded.
+
+A due reminder is claimed by clearing ``remind_at`` only if it still holds
+the value that was scheduled. Stale heap entries and reminders already sent
+by another worker are skipped that way. The claim is a todo write like any
+other: it takes a new revision and is published to the owner's streams. The notification itself is sent by
+the job worker.
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.orm import Session
+
+from . import cache, events, jobs, queries, sharding, sync
+from .models import Todo
+
+logger = logging.getLogger(__name__)
+notification_logger = logging.getLogger("todo_app.notifications")
+
+# keyset position before any reminder
+START = (datetime.min, 0)
+
+
+@jobs.handler("send_reminder")
+def send_reminder(db: Session, payload: dict):
+    # local notification sink: the user's open tabs and the notification log
+    notification_logger.info(
+        "reminder user_id=%s todo_id=%s %s",
+        payload["owner_id"],
+        payload["todo_id"],
+        payload["task"],
+    )
+    events.bus.publish(payload["owner_id"], {"type": "reminder", **payload})
+
+
+class ReminderScheduler:
+    def __init__(
+        self,
+        session_factory,
+        lookahead: timedelta = timedelta(minutes=5),
+        refill_interval: timedelta = timedelta(minutes=1),
+        max_heap: int = 10000,
+        rescan_every: int = 10,
+    ):
+        self.session_factory = session_factory
+        self.lookahead = lookahead
+        self.refill_interval = refill_interval
+        self.max_heap = max_heap
+        # now and then start the scan from the beginning, to pick up reminders
+        # written behind the loaded window by other processes
+        self.rescan_every = rescan_every
+        self._heap = []
+        self._queued = {}
+        self._loaded_until = START
+        self._horizon = datetime.min
+        self._refills = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _push(self, remind_at: datetime, todo_id: int, owner_id: int) -> bool:
+        if self._queued.get(todo_id) == remind_at:
+            return False
+        if len(self._heap) >= self.max_heap:
+            self._loaded_until = START  # dropped, a rescan will find it
+            return False
+        self._queued[todo_id] = remind_at
+        heapq.heappush(self._heap, (remind_at, todo_id, owner_id))
+        return True
+
+    def refill(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        self._refills += 1
+        with self._lock:
+            if self._refills % self.rescan_every == 0:
+                self._loaded_until = START
+            room = self.max_heap - len(self._heap)
+            loaded_until = self._loaded_until
+        if room <= 0:
+            return 0
+        horizon = now + self.lookahead
+        statement = (
+            select(Todo.remind_at, Todo.id, Todo.owner_id)
+            .where(Todo.remind_at.isnot(None))
+            .where(Todo.remind_at <= horizon)
+            .where(tuple_(Todo.remind_at, Todo.id) > tuple_(*loaded_until))
+            .order_by(Todo.remind_at, Todo.id)
+            .limit(room)
+        )
+        with self.session_factory() as db:
+            rows = db.execute(statement).all()
+        with self._lock:
+            for remind_at, todo_id, owner_id in rows:
+                self._push(remind_at, todo_id, owner_id)
+            if len(rows) == room:
+                # heap is full, the rest of the window waits for the next refill
+                self._loaded_until = tuple(rows[-1][:2])
+                self._horizon = rows[-1][0]
+            else:
+                self._loaded_until = (horizon, 2**63 - 1)
+                self._horizon = horizon
+        return len(rows)
+
+    def schedule(self, todo: Todo):
+        """Queue a just committed reminder that the loaded window already covers."""
+        if todo.remind_at is None:
+            return
+        with self._lock:
+            if todo.remind_at > self._horizon:
+                return  # a later refill will load it
+            earliest = self._heap[0][0] if self._heap else None
+            pushed = self._push(todo.remind_at, todo.id, todo.owner_id)
+        if pushed and (earliest is None or todo.remind_at < earliest):
+            self.wake()
+
+    def pop_due(self, now: datetime) -> list:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                remind_at, todo_id, owner_id = heapq.heappop(self._heap)
+                if self._queued.get(todo_id) == remind_at:
+                    del self._queued[todo_id]
+                    due.append((remind_at, todo_id, owner_id))
+        return due
+
+    def dispatch_due(self, now: Optional[datetime] = None) -> int:
+        due = self.pop_due(now or datetime.utcnow())
+        if not due:
+            return 0
+        sent = []
+        try:
+            with self.session_factory() as db:
+                for remind_at, todo_id, owner_id in due:
+                    claimed = db.execute(
+                        update(Todo)
+                        .where(Todo.id == todo_id)
+                        .where(Todo.remind_at == remind_at)
+                        .values(remind_at=None, updated_at=datetime.utcnow())
+                        .returning(Todo.task, Todo.due_at),
+                        execution_options={"synchronize_session": False},
+                    ).first()
+                    if claimed is None:
+                        continue  # moved, deleted or sent by another worker
+                    # clearing remind_at is a change delta clients must see;
+                    # only a won claim takes a revision and the user-row lock
+                    db.execute(
+                        update(Todo)
+                        .where(Todo.id == todo_id)
+                        .values(revision=sync.next_revision(db, owner_id)),
+                        execution_options={"synchronize_session": False},
+                    )
+                    jobs.enqueue(
+                        db,
+                        "send_reminder",
+                        todo_id=todo_id,
+                        owner_id=owner_id,
+                        task=claimed.task,
+                        due_at=claimed.due_at.isoformat() if claimed.due_at else None,
+                    )
+                    cache.invalidate_after_commit(db, owner_id, todo_id)
+                    sent.append(todo_id)
+                db.commit()
+        except Exception:
+            # nothing was claimed, queue them again for the next attempt
+            with self._lock:
+                for entry in due:
+                    self._push(*entry)
+            raise
+        if sent:
+            with self.session_factory() as db:
+                for row in queries.todos_by_ids(db, sent):
+                    events.publish_todo_data("updated", row)
+        return len(sent)
+
+    def wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        next_refill = datetime.min
+        failures = 0
+        try:
+            while True:
+                self._wakeup.clear()
+                now = datetime.utcnow()
+                try:
+                    if now >= next_refill:
+                        await asyncio.to_thread(self.refill, now)
+                        next_refill = now + self.refill_interval
+                    await asyncio.to_thread(self.dispatch_due, now)
+                    failures = 0
+                except Exception:
+                    # e.g. a dropped connection, keep the scheduler alive
+                    failures += 1
+                    logger.exception("dispatching reminders failed")
+                    await asyncio.sleep(jobs.retry_delay(failures))
+                    continue
+                with self._lock:
+                    wake_at = min(
+                        [next_refill] + ([self._heap[0][0]] if self._heap else [])
+                    )
+                timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+
+
+# shard name -> the scheduler for the reminders stored there
+schedulers: dict = {}
+
+
+def schedule(todo: Todo):
+    scheduler = schedulers.get(sharding.shards.name_for(todo.owner_id))
+    if scheduler is not None:
+        scheduler.schedule(todo)
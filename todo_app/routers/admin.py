@@ -1,54 +1,125 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
 
 from .auth import get_current_user
-
-from ..models import Todo, User
-from ..database import SessionLocal
+from .. import cache, jobs, queries, sharding, stats
 
 router = APIRouter(tags=["admin"], prefix="/admin")
 
 
-def get_db():
+user_dependency = Annotated[dict, Depends(get_current_user)]
+
+
+# sessions on the admin's own shard, where their user row is; listings of
+# everyone query every shard through sharding.fan_out_reads
+def get_db(user: user_dependency):
+    db = sharding.shards.session_for(user["user_id"] if user else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request, user: user_dependency):
+    db = sharding.read_session(request, user["user_id"] if user else None)
     try:
-        db = SessionLocal()
         yield db
     finally:
         db.close()
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
-user_dependency = Annotated[dict, Depends(get_current_user)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+page_limit = Query(default=100, gt=0, le=1000)
 
 
 @router.get("/all_users")
-async def view_all_users(db: db_dependency, user: user_dependency):
-
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+async def view_all_users(
+    db: read_db_dependency,
+    user: user_dependency,
+    after_id: int = Query(default=0, ge=0),
+    limit: int = page_limit,
+):
+
+    user_model = queries.user_by_id(db, user["user_id"])
     if not user_model.role == "admin":
         return {"message": "Not Authorized to access this url"}
 
-    return db.query(User).all()
+    # next page: pass the last id as after_id
+    pages = await sharding.fan_out_reads(
+        db, lambda shard_db: queries.all_users(shard_db, after_id, limit)
+    )
+    return sharding.merge_pages(pages, lambda row: row["id"], limit)
 
 
 @router.get("/all_todos")
-async def view_all_todos(db: db_dependency, user: user_dependency):
-
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+async def view_all_todos(
+    db: read_db_dependency,
+    user: user_dependency,
+    after_owner_id: int = Query(default=0, ge=0),
+    after_id: int = Query(default=0, ge=0),
+    limit: int = page_limit,
+):
+
+    user_model = queries.user_by_id(db, user["user_id"])
     if not user_model.role == "admin":
         return {"message": "Not Authorized to access this url"}
 
-    todo_model = db.query(Todo).all()
-    return todo_model
+    # next page: pass the last owner_id and id as after_owner_id and after_id
+    after = (after_owner_id, after_id)
+    pages = await sharding.fan_out_reads(
+        db, lambda shard_db: queries.all_todos(shard_db, after, limit)
+    )
+    return sharding.merge_pages(pages, lambda row: (row["owner_id"], row["id"]), limit)
 
 
 @router.get("/all_todos/{user_id}")
-async def view_todos_user_id(db: db_dependency, user: user_dependency, user_id: int):
+async def view_todos_user_id(
+    db: read_db_dependency, user: user_dependency, user_id: int
+):
+
+    user_model = queries.user_by_id(db, user["user_id"])
+    if not user_model.role == "admin":
+        return {"message": "Not Authorized to access this url"}
+
+    with sharding.shards.session_for(user_id) as owner_db:
+        return queries.todos_for_owner(owner_db, user_id)
+
+
+@router.get("/users_by_load")
+async def view_users_by_load(
+    db: read_db_dependency, user: user_dependency, limit: int = Query(default=20, gt=0)
+):
+
+    user_model = queries.user_by_id(db, user["user_id"])
+    if not user_model.role == "admin":
+        return {"message": "Not Authorized to access this url"}
+
+    pages = await sharding.fan_out_reads(
+        db, lambda shard_db: stats.users_by_load(shard_db, limit)
+    )
+    return sharding.merge_pages(pages, lambda row: (-row["open"], row["id"]), limit)
+
+
+@router.get("/cache_stats")
+async def view_cache_stats(db: read_db_dependency, user: user_dependency):
+
+    user_model = queries.user_by_id(db, user["user_id"])
+    if not user_model.role == "admin":
+        return {"message": "Not Authorized to access this url"}
+
+    return cache.todo_cache.metrics()
+
+
+@router.post("/recompute_stats/{user_id}", status_code=202)
+async def recompute_user_stats(db: db_dependency, user: user_dependency, user_id: int):
 
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = queries.user_by_id(db, user["user_id"])
     if not user_model.role == "admin":
         return {"message": "Not Authorized to access this url"}
 
-    todo_model = db.query(Todo).filter(Todo.owner_id == user_id).all()
-    return todo_model
+    # the job runs on the shard that holds the user's todos
+    with sharding.shards.session_for(user_id) as owner_db:
+        jobs.enqueue(owner_db, "recompute_stats", user_id=user_id)
+        owner_db.commit()
@@ -6,12 +6,12 @@ from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from starlette import status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from jose import JWTError, jwt
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 
 from ..database import SessionLocal
-from ..models import User
+from ..models import User, UserDirectory
+from .. import jobs, queries, sharding
+from ..templating import templates
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -36,7 +36,12 @@ db_dependency = Annotated[Session, Depends(get_db)]
 
 
 def authenticate(db: db_dependency, email: str, password: str):
-    user_model = db.query(User).filter(User.email == email).first()
+    # the directory knows the id, the id knows the shard
+    entry = queries.directory_entry(db, email)
+    if entry is None:
+        return False
+    with sharding.shards.session_for(entry.id) as shard_db:
+        user_model = shard_db.get(User, entry.id)
     if user_model is None:
         return False
     if bcrypt_context.verify(password, user_model.hashed_password):
@@ -46,6 +51,8 @@ def authenticate(db: db_dependency, email: str, password: str):
 
 # encode
 def create_access_token(user_name: str, user_id: int, expires_delta: timedelta):
+    from jose import jwt  # deferred, it pulls in rsa/ecdsa/pyasn1 at import
+
     encode = {"sub": user_name, "id": user_id}
     expires = datetime.now() + expires_delta
     encode.update({"exp": expires})
@@ -54,6 +61,8 @@ def create_access_token(user_name: str, user_id: int, expires_delta: timedelta):
 
 # decode
 async def get_current_user(request: Request):
+    from jose import JWTError, jwt
+
     try:
         token = request.cookies.get("access_token")
         if token is None:
@@ -68,6 +77,37 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
+def enqueue_welcome(db: Session, user_model: User):
+    # sent by the job worker once the user is committed, not while they wait
+    jobs.enqueue(
+        db,
+        "send_email",
+        to=user_model.email,
+        subject="Welcome to TodoApp",
+        body=f"Hi {user_model.first_name}, your account is ready.",
+    )
+    jobs.enqueue(db, "audit_log", action="user_registered", user_id=user_model.id)
+
+
+def add_user(db: Session, user_model: User):
+    """Take an id from the directory on ``db``, then store the user on its shard."""
+    entry = UserDirectory(email=user_model.email)
+    db.add(entry)
+    db.commit()  # reserves the id and the email
+    user_model.id = entry.id
+    shard_db = sharding.shards.session_for(entry.id)
+    try:
+        shard_db.add(user_model)
+        enqueue_welcome(shard_db, user_model)
+        shard_db.commit()
+    except Exception:
+        db.delete(entry)
+        db.commit()
+        raise
+    finally:
+        shard_db.close()
+
+
 class UserRequest(BaseModel):
     email: str = Field(min_length=5, max_length=50)
     password: str = Field(min_length=5, max_length=20)
@@ -78,8 +118,6 @@ class UserRequest(BaseModel):
 
 # ------------------------------------------
 
-templates = Jinja2Templates(directory="templates")
-
 
 class LoginForm:
     def __init__(self, request: Request):
@@ -149,7 +187,7 @@ async def register(
         return templates.TemplateResponse(
             "register.html", {"request": request, "msg": msg}
         )
-    user_model_check = db.query(User).filter(User.email == email).first()
+    user_model_check = queries.directory_entry(db, email)
     if user_model_check is not None:
         msg = "Email already exist"
         return templates.TemplateResponse(
@@ -163,8 +201,7 @@ async def register(
         is_active=True,
         role=role,
     )
-    db.add(user_model)
-    db.commit()
+    add_user(db, user_model)
     msg = "User successfully created"
     return templates.TemplateResponse("login.html", {"request": request, "msg": msg})
 
@@ -184,8 +221,7 @@ async def create_user(db: db_dependency, new_user: UserRequest):
         role=new_user.role,
     )
 
-    db.add(user_model)
-    db.commit()
+    add_user(db, user_model)
 
 
 @router.post("/token", status_code=status.HTTP_200_OK)
@@ -1,27 +1,44 @@
-from fastapi import APIRouter, Form, Request
+import asyncio
+import json
+from datetime import datetime, timezone
+from fastapi import APIRouter, Form, Request, WebSocket, WebSocketDisconnect
 from typing import Annotated, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, Path
+from fastapi import Depends, HTTPException, Path, Query
 from fastapi import status
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.responses import RedirectResponse
 
 from .auth import get_current_user
 
-from ..models import Todo
-from ..database import engine, SessionLocal
+from ..models import Tag, Todo
+from .. import cache, events, queries, reminders, sharding, stats, sync, writebehind
+from ..templating import templates
 
 router = APIRouter(tags=["todos"])
 
-templates = Jinja2Templates(directory="templates")
+
+user_dependency = Annotated[dict, Depends(get_current_user)]
+
+
+def user_id_of(user: Optional[dict]) -> Optional[int]:
+    return user["user_id"] if user else None
 
 
 # Dependency function helps to open database, and return session for request
 # Closes the database while response
-def get_db():
-    db = SessionLocal()
+def get_db(user: user_dependency):
+    # everything a user owns lives on their shard
+    db = sharding.shards.session_for(user_id_of(user))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request, user: user_dependency):
+    db = sharding.read_session(request, user_id_of(user))
     try:
         yield db
     finally:
@@ -29,7 +46,7 @@ def get_db():
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
-user_dependency = Annotated[dict, Depends(get_current_user)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
 
 
 class TodoRequest(BaseModel):
@@ -37,19 +54,66 @@ class TodoRequest(BaseModel):
     description: Optional[str] = None
     priority: int = Field(gt=0, lt=6)
     completed: bool = Field(default=0)
+    due_at: Optional[datetime] = None
+    remind_at: Optional[datetime] = None
+
+    @field_validator("due_at", "remind_at")
+    @classmethod
+    def as_naive_utc(cls, value: Optional[datetime]):
+        # stored naive in UTC, like updated_at
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class TagsRequest(BaseModel):
+    tags: list[Annotated[str, Field(min_length=1, max_length=30)]]
+
+
+def parse_form_datetime(value: Optional[str]) -> Optional[datetime]:
+    # <input type="datetime-local"> sends "2024-06-19T18:05", or "" when empty
+    return datetime.fromisoformat(value) if value else None
 
 
 # --------------------------------
 
 
+def is_fragment_request(request: Request):
+    # htmx-style: the page's own scripts mark requests that only want the row back
+    return request.headers.get("HX-Request") == "true"
+
+
+def login_redirect(request: Request):
+    # fetch() follows redirects, the login page would be spliced in as a row
+    if is_fragment_request(request):
+        return HTMLResponse("", status_code=status.HTTP_401_UNAUTHORIZED)
+    return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
+
+
+def missing_todo_redirect(request: Request):
+    # a fragment request drops the row, a page load goes back home
+    if is_fragment_request(request):
+        return HTMLResponse("", status_code=status.HTTP_404_NOT_FOUND)
+    return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
+
+
+def todo_row_response(request: Request, todo: Todo, status_code: int = 200):
+    return templates.TemplateResponse(
+        "todo-row.html", {"request": request, "todo": todo}, status_code=status_code
+    )
+
+
 @router.get("/home", response_class=HTMLResponse)
-async def home_page(db: db_dependency, request: Request):
+async def home_page(db: read_db_dependency, request: Request):
     user = await get_current_user(request)
     if user is None:
         return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
-    todos = db.query(Todo).filter(Todo.owner_id == user["user_id"]).all()
+    todos = queries.todo_rows_for_owner(db, user["user_id"])
+    todos = writebehind.apply_pending(user["user_id"], todos)
+    todo_stats = stats.for_user(db, user["user_id"])
     return templates.TemplateResponse(
-        "home.html", {"request": request, "todos": todos, "user": user}
+        "home.html",
+        {"request": request, "todos": todos, "user": user, "stats": todo_stats},
     )
 
 
@@ -70,28 +134,49 @@ async def create_todo(
     task: str = Form(...),
     description: str = Form(...),
     priority: str = Form(...),
+    due_at: Optional[str] = Form(None),
+    remind_at: Optional[str] = Form(None),
 ):
     user = await get_current_user(request)
     if user is None:
-        return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
+        return login_redirect(request)
     todo_model = Todo()
     todo_model.task = task
     todo_model.description = description
     todo_model.priority = priority
+    todo_model.due_at = parse_form_datetime(due_at)
+    todo_model.remind_at = parse_form_datetime(remind_at)
     todo_model.owner_id = user["user_id"]
+    sync.touch_todo(db, todo_model)
     db.add(todo_model)
     db.commit()
+    events.publish_todo("created", todo_model)
+    reminders.schedule(todo_model)
+    if is_fragment_request(request):
+        return todo_row_response(request, todo_model, status.HTTP_201_CREATED)
     return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
 
 
+@router.get("/home/row/{todo_id}", response_class=HTMLResponse)
+async def home_page_row(request: Request, db: db_dependency, todo_id: int):
+    user = await get_current_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    todo_model = cache.get_todo(db, user["user_id"], todo_id)
+    if todo_model is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    todo_model = writebehind.apply_pending(user["user_id"], [todo_model])[0]
+    return todo_row_response(request, todo_model)
+
+
 @router.get("/edit/{todo_id}", response_class=HTMLResponse)
 async def edit_todo(request: Request, todo_id: int, db: db_dependency):
     user = await get_current_user(request)
     if user is None:
-        return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
-    todo_model = db.query(Todo).filter(Todo.id == todo_id).first()
+        return login_redirect(request)
+    todo_model = cache.get_todo(db, user["user_id"], todo_id)
     if todo_model is None:
-        return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
+        return missing_todo_redirect(request)
     return templates.TemplateResponse(
         "edit-todo.html", {"request": request, "todo": todo_model, "user": user}
     )
@@ -105,18 +190,27 @@ async def edit_new_todo(
     task: str = Form(),
     description: str = Form(),
     priority: str = Form(),
+    due_at: Optional[str] = Form(None),
+    remind_at: Optional[str] = Form(None),
 ):
     user = await get_current_user(request)
     if user is None:
-        return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
-    todo_model = db.query(Todo).filter(Todo.id == todo_id).first()
+        return login_redirect(request)
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id)
     if todo_model is None:
-        return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
+        return missing_todo_redirect(request)
     todo_model.task = task
     todo_model.description = description
     todo_model.priority = priority
+    todo_model.due_at = parse_form_datetime(due_at)
+    todo_model.remind_at = parse_form_datetime(remind_at)
+    sync.touch_todo(db, todo_model)
     db.add(todo_model)
     db.commit()
+    events.publish_todo("updated", todo_model)
+    reminders.schedule(todo_model)
+    if is_fragment_request(request):
+        return todo_row_response(request, todo_model)
     return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
 
 
@@ -124,16 +218,16 @@ async def edit_new_todo(
 async def delete_the_todo(request: Request, db: db_dependency, todo_id: int):
     user = await get_current_user(request)
     if user is None:
-        return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
-    todo_model = (
-        db.query(Todo)
-        .filter(Todo.id == todo_id)
-        .filter(Todo.owner_id == user["user_id"])
-    )
+        return login_redirect(request)
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id)
     if todo_model is None:
-        return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
-    db.query(Todo).filter(Todo.id == todo_id).delete()
+        return missing_todo_redirect(request)
+    revision = sync.record_delete(db, todo_model)
+    db.delete(todo_model)
     db.commit()
+    events.publish_delete(user["user_id"], todo_id, revision)
+    if is_fragment_request(request):
+        return HTMLResponse("")
     return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
 
 
@@ -141,11 +235,31 @@ async def delete_the_todo(request: Request, db: db_dependency, todo_id: int):
 async def completed_the_task(request: Request, db: db_dependency, todo_id: int):
     user = await get_current_user(request)
     if user is None:
-        return RedirectResponse(url="auth/login", status_code=status.HTTP_302_FOUND)
-    db.query(Todo).filter(Todo.id == todo_id).first().completed = (
-        not db.query(Todo).filter(Todo.id == todo_id).first().completed
-    )
+        return login_redirect(request)
+    if writebehind.buffer_for(user["user_id"]) is not None:
+        return toggle_buffered(request, db, user["user_id"], todo_id)
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id)
+    if todo_model is None:
+        return missing_todo_redirect(request)
+    todo_model.completed = not todo_model.completed
+    sync.touch_todo(db, todo_model)
     db.commit()
+    events.publish_todo("updated", todo_model)
+    if is_fragment_request(request):
+        return todo_row_response(request, todo_model)
+    return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
+
+
+def toggle_buffered(request: Request, db: Session, owner_id: int, todo_id: int):
+    # write-behind mode: record the click, the buffer commits it in a batch
+    todo_model = cache.get_todo(db, owner_id, todo_id)
+    if todo_model is None:
+        return missing_todo_redirect(request)
+    completed = writebehind.buffer_for(owner_id).toggle_completed(
+        owner_id, todo_id, bool(todo_model["completed"])
+    )
+    if is_fragment_request(request):
+        return todo_row_response(request, {**todo_model, "completed": completed})
     return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
 
 
@@ -154,26 +268,97 @@ async def completed_the_task(request: Request, db: db_dependency, todo_id: int):
 
 @router.get("/", status_code=status.HTTP_200_OK)
 async def read_all(
-    db: db_dependency,
+    request: Request,
+    db: read_db_dependency,
     user: user_dependency,
+    tags: Annotated[Optional[list[str]], Query()] = None,
+    match: str = Query(default="any", pattern="^(any|all)$"),
 ):
+    # "/" is also the site root, a browser opening it gets the home page
+    if user is None or "text/html" in request.headers.get("accept", ""):
+        return RedirectResponse(url="/home", status_code=status.HTTP_302_FOUND)
     # Depends->dependency injection
-    return db.query(Todo).filter(Todo.owner_id == user["user_id"]).all()
+    todos = queries.todos_for_owner(
+        db, user["user_id"], tags=tags, match_all=match == "all"
+    )
+    return writebehind.apply_pending(user["user_id"], todos)
     # database is passed when the endpoint is hit
 
 
+@router.get("/todos/changes", status_code=status.HTTP_200_OK)
+async def read_changes(
+    db: db_dependency,
+    user: user_dependency,
+    since: int = Query(default=0, ge=0),
+):
+    # offline clients send back the revision from their last sync and only
+    # get the todos written after it plus the ids deleted since then
+    return sync.changes_since(db, user["user_id"], since)
+
+
+@router.get("/todos/archived", status_code=status.HTTP_200_OK)
+async def read_archived(
+    db: read_db_dependency,
+    user: user_dependency,
+    before: Optional[int] = Query(default=None, gt=0),
+    limit: int = Query(default=50, gt=0, le=200),
+):
+    # keyset pagination: pass the returned "next" as ``before`` for the next page
+    todos = queries.archived_for_owner(db, user["user_id"], before, limit)
+    next_before = todos[-1]["id"] if len(todos) == limit else None
+    return {"todos": todos, "next": next_before}
+
+
+@router.get("/todos/events")
+async def stream_events(request: Request):
+    user = await get_current_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    async def event_stream():
+        queue = events.bus.subscribe(user["user_id"])
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.bus.unsubscribe(user["user_id"], queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.websocket("/todos/ws")
+async def websocket_events(websocket: WebSocket):
+    try:
+        user = await get_current_user(websocket)
+    except HTTPException:
+        user = None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    queue = events.bus.subscribe(user["user_id"])
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        events.bus.unsubscribe(user["user_id"], queue)
+
+
 @router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK)
 async def read_by_id(
-    db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)
+    db: read_db_dependency, user: user_dependency, todo_id: int = Path(gt=0)
 ):
-    todo_model = (
-        db.query(Todo)
-        .filter(Todo.owner_id == user["user_id"])
-        .filter(Todo.id == todo_id)
-        .first()
-    )
+    todo_model = cache.get_todo(db, user["user_id"], todo_id)
     if todo_model is not None:
-        return todo_model
+        return writebehind.apply_pending(user["user_id"], [todo_model])[0]
     raise HTTPException(status_code=404, detail="Todo not found")
 
 
@@ -185,8 +370,11 @@ async def create_todo(
 ):
     new_todo_object = Todo(**new_todo.model_dump())
     new_todo_object.owner_id = user["user_id"]
+    sync.touch_todo(db, new_todo_object)
     db.add(new_todo_object)
     db.commit()
+    events.publish_todo("created", new_todo_object)
+    reminders.schedule(new_todo_object)
 
 
 @router.put("/todo/update_todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -197,12 +385,7 @@ async def update_todo(
     todo_id: int = Path(gt=0),
 ):
 
-    todo_model = (
-        db.query(Todo)
-        .filter(Todo.owner_id == user["user_id"])
-        .filter(Todo.id == todo_id)
-        .first()
-    )
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id)
     if todo_model is None:
         raise HTTPException(status_code=404, detail="todo not found")
 
@@ -210,9 +393,42 @@ async def update_todo(
     todo_model.description = update_todo.description
     todo_model.priority = update_todo.priority
     todo_model.completed = update_todo.completed
+    todo_model.due_at = update_todo.due_at
+    todo_model.remind_at = update_todo.remind_at
+    sync.touch_todo(db, todo_model)
 
     db.add(todo_model)
     db.commit()
+    events.publish_todo("updated", todo_model)
+    reminders.schedule(todo_model)
+
+
+@router.put("/todo/{todo_id}/tags", status_code=status.HTTP_200_OK)
+async def set_todo_tags(
+    db: db_dependency,
+    user: user_dependency,
+    tags_request: TagsRequest,
+    todo_id: int = Path(gt=0),
+):
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id, with_tags=True)
+    if todo_model is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+
+    names = queries.tag_names(tags_request.tags)
+    existing = (
+        db.query(Tag)
+        .filter(Tag.owner_id == user["user_id"])
+        .filter(Tag.name.in_(names))
+        .all()
+    )
+    by_name = {tag.name: tag for tag in existing}
+    todo_model.tags = [
+        by_name.get(name) or Tag(owner_id=user["user_id"], name=name) for name in names
+    ]
+    sync.touch_todo(db, todo_model)
+    db.commit()
+    events.publish_todo("updated", todo_model)
+    return {"id": todo_id, "tags": names}
 
 
 @router.delete("/todo/delete_todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -220,15 +436,11 @@ async def delete_todo(
     db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)
 ):
 
-    todo_model = (
-        db.query(Todo)
-        .filter(Todo.owner_id == user["user_id"])
-        .filter(Todo.id == todo_id)
-    )
+    todo_model = queries.owned_todo(db, user["user_id"], todo_id)
     if todo_model is None:
         raise HTTPException(status_code=404, detail="Todo not found")
 
-    todo_model.delete()
-    # or
-    # db.query(Todo).filter(Todo.id == todo_id).delete()
+    revision = sync.record_delete(db, todo_model)
+    db.delete(todo_model)
     db.commit()
+    events.publish_delete(user["user_id"], todo_id, revision)
@@ -1,25 +1,34 @@
 from fastapi import APIRouter, Form, Request
 from typing import Annotated
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException
 from starlette import status
-from passlib.context import CryptContext
 
-from .auth import get_current_user
+from .auth import bcrypt_context, get_current_user
 
 from ..models import User
-from ..database import SessionLocal
+from .. import jobs, queries, sharding
+from ..templating import templates
 
 router = APIRouter(prefix="/user", tags=["users"])
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+user_dependency = Annotated[dict, Depends(get_current_user)]
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(user: user_dependency):
+    # the user's row lives on their shard
+    db = sharding.shards.session_for(user["user_id"] if user else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request, user: user_dependency):
+    db = sharding.read_session(request, user["user_id"] if user else None)
     try:
         yield db
     finally:
@@ -27,7 +36,7 @@ def get_db():
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
-user_dependency = Annotated[dict, Depends(get_current_user)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
 
 
 class UpdatePasswordRequest(BaseModel):
@@ -35,17 +44,26 @@ class UpdatePasswordRequest(BaseModel):
     new_password: str = Field(min_length=5, max_length=20)
 
 
-# -----------------------------------------
+def enqueue_password_changed(db: Session, user_model: User):
+    jobs.enqueue(
+        db,
+        "send_email",
+        to=user_model.email,
+        subject="Your TodoApp password was changed",
+        body="If this wasn't you, reset your password right away.",
+    )
+    jobs.enqueue(db, "audit_log", action="password_changed", user_id=user_model.id)
+
 
-templates = Jinja2Templates(directory="templates")
+# -----------------------------------------
 
 
 @router.get("/profile", response_class=HTMLResponse)
-async def get_profile(request: Request, db: db_dependency):
+async def get_profile(request: Request, db: read_db_dependency):
     user = await get_current_user(request)
     if user is None:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = queries.user_by_id(db, user["user_id"])
     return templates.TemplateResponse(
         "profile.html", {"request": request, "user": user_model}
     )
@@ -72,7 +90,7 @@ async def change_password_page(
     user = await get_current_user(request)
     if user is None:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = queries.user_by_id(db, user["user_id"])
     if not bcrypt_context.verify(old_password, user_model.hashed_password):
         msg = "Incorrect old password"
         return templates.TemplateResponse(
@@ -85,6 +103,7 @@ async def change_password_page(
         )
     user_model.hashed_password = bcrypt_context.hash(new_password)
     db.add(user_model)
+    enqueue_password_changed(db, user_model)
     db.commit()
     msg = "Password changed"
     return templates.TemplateResponse("login.html", {"request": request, "msg": msg})
@@ -100,11 +119,12 @@ async def update_password(
     update_password_body: UpdatePasswordRequest,
 ):
 
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = queries.user_by_id(db, user["user_id"])
     if not bcrypt_context.verify(
         update_password_body.old_password, user_model.hashed_password
     ):
         return "Invalid old password"
     user_model.hashed_password = bcrypt_context.hash(update_password_body.new_password)
     db.add(user_model)
+    enqueue_password_changed(db, user_model)
     db.commit()
@@ -0,0 +1,67 @@
+"""Production entry point.
+
+    python -m todo_app [--host HOST] [--port PORT] [--workers N]
+
+Runs ``todo_app.main:app`` on uvicorn with one worker per core by default,
+using uvloop and httptools when they are installed. On SIGTERM uvicorn stops
+accepting connections, lets in-flight requests finish for up to
+``--graceful-timeout`` seconds, then runs the lifespan shutdown, which flushes
+buffered writes and disposes the connection pools. Point the load balancer's
+health checks at /readyz and /healthz. With more than one worker the
+in-process todo cache is turned off, see cache.py.
+"""
+
+import argparse
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    return int(os.environ.get("TODO_WORKERS", os.cpu_count() or 1))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m todo_app")
+    parser.add_argument("--host", default=os.environ.get("TODO_HOST", "0.0.0.0"))
+    parser.add_argument(
+        "--port", type=int, default=int(os.environ.get("TODO_PORT", "8000"))
+    )
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=30,
+        help="seconds in-flight requests get to finish on shutdown",
+    )
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers > 1 and os.environ.get("TODO_EVENTS_FANOUT") != "postgres":
+        logger.warning(
+            "%s workers without TODO_EVENTS_FANOUT=postgres: live updates only "
+            "reach clients connected to the worker that made the change",
+            args.workers,
+        )
+    if args.workers > 1:
+        # the todo cache is invalidated per process, other workers would
+        # keep serving what they cached before a write
+        os.environ["TODO_CACHE"] = "off"
+    uvicorn.run(
+        "todo_app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="auto",
+        http="auto",
+        lifespan="on",
+        proxy_headers=True,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
@@ -0,0 +1,142 @@
+"""Horizontal sharding by owner.
+
+With ``TODO_SHARD_URLS`` set to comma separated ``name=url`` pairs (bare urls
+are named shard0, shard1, ...), every user and everything they own lives on
+the shard their id hashes to on a consistent-hash ring. That covers their
+todos, tags, tombstones, stats, archive and the jobs their writes enqueue.
+Owner-scoped handlers get a session on that shard, admin listings query all
+shards at once, and each shard has its own background workers. Adding or
+removing a shard moves only the users whose ring position changes, and
+``python -m todo_app.rebalance`` moves them.
+
+Only the user directory, which hands out user ids and maps emails to them
+for login, and the idempotency keys stay on the primary database. Without
+``TODO_SHARD_URLS`` the primary is the only shard.
+
+Every shard carries the full schema, so run the alembic migrations against
+each of them.
+"""
+
+import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import itertools
+import os
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import database
+from .database import SessionLocal
+
+SHARD_URLS = os.environ.get("TODO_SHARD_URLS", "")
+# points per shard on the ring, more spread the users more evenly
+VIRTUAL_NODES = 64
+
+
+def parse_shard_urls(value: str) -> dict:
+    urls = {}
+    for index, item in enumerate(part for part in value.split(",") if part):
+        name, separator, url = item.partition("=")
+        if not separator or "://" in name:
+            name, url = f"shard{index}", item
+        urls[name.strip()] = url.strip()
+    return urls
+
+
+class HashRing:
+    def __init__(self, names: list, virtual_nodes: int = VIRTUAL_NODES):
+        self._points = sorted(
+            (self._hash(f"{name}#{index}"), name)
+            for name in names
+            for index in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in self._points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node_for(self, owner_id: int) -> str:
+        index = bisect.bisect(self._keys, self._hash(str(owner_id)))
+        return self._points[index % len(self._points)][1]
+
+
+class ShardSet:
+    def __init__(self, engines: dict):
+        self.engines = engines
+        self.ring = HashRing(list(engines))
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.engines) > 1
+
+    def name_for(self, owner_id: Optional[int]) -> str:
+        if owner_id is None:
+            # nobody is signed in, the handler won't touch owner data
+            return next(iter(self.engines))
+        return self.ring.node_for(owner_id)
+
+    def engine_for(self, owner_id: Optional[int]) -> Engine:
+        return self.engines[self.name_for(owner_id)]
+
+    def session_for(self, owner_id: Optional[int]) -> Session:
+        return SessionLocal(bind=self.engine_for(owner_id))
+
+    def session_factories(self) -> dict:
+        """name -> session factory, for the per-shard background workers."""
+        return {
+            name: functools.partial(SessionLocal, bind=engine)
+            for name, engine in self.engines.items()
+        }
+
+    async def fan_out(self, query) -> list:
+        """Run ``query(db)`` on every shard concurrently, one result per shard."""
+
+        def run(engine):
+            with SessionLocal(bind=engine) as db:
+                return query(db)
+
+        return await asyncio.gather(
+            *(asyncio.to_thread(run, engine) for engine in self.engines.values())
+        )
+
+    def dispose(self):
+        for engine in self.engines.values():
+            if engine is not database.engine:
+                engine.dispose()
+
+
+def merge_pages(pages: list, key, limit: int, reverse: bool = False) -> list:
+    """Merge per-shard pages, each sorted by ``key``, into the first ``limit``."""
+    return list(itertools.islice(heapq.merge(*pages, key=key, reverse=reverse), limit))
+
+
+async def fan_out_reads(read_db: Session, query) -> list:
+    """``shards.fan_out(query)``, or ``query(read_db)`` when there is one shard."""
+    if shards.sharded:
+        return await shards.fan_out(query)
+    # read_db may be a replica, the primary shard needn't serve the listing
+    return [query(read_db)]
+
+
+def read_session(request, owner_id: Optional[int]) -> Session:
+    """Session for an owner's read-only handlers."""
+    if shards.sharded:
+        return shards.session_for(owner_id)
+    # a single database can spread reads over its replicas
+    return database.read_session(request)
+
+
+def _configured() -> ShardSet:
+    urls = parse_shard_urls(SHARD_URLS)
+    if not urls:
+        return ShardSet({"primary": database.engine})
+    return ShardSet({name: create_engine(url) for name, url in urls.items()})
+
+
+shards = _configured()
@@ -0,0 +1,84 @@
+// Updates the todo table in place: actions fetch just the changed row, and
+// changes made in other tabs or devices arrive over the event stream.
+(function () {
+  var rows = document.getElementById("todo-rows");
+  if (!rows) {
+    return;
+  }
+
+  function rowFor(id) {
+    return document.getElementById("todo-" + id);
+  }
+
+  function renumber() {
+    var all = rows.getElementsByTagName("tr");
+    for (var i = 0; i < all.length; i++) {
+      all[i].cells[0].textContent = i + 1;
+    }
+  }
+
+  function swapRow(id, html) {
+    var row = rowFor(id);
+    if (html.trim() === "") {
+      if (row) {
+        row.parentNode.removeChild(row);
+      }
+    } else if (row) {
+      row.outerHTML = html;
+    } else {
+      rows.insertAdjacentHTML("beforeend", html);
+    }
+    renumber();
+  }
+
+  function fetchRow(url, id) {
+    return fetch(url, { headers: { "HX-Request": "true" }, credentials: "same-origin" })
+      .then(function (response) {
+        if (response.redirected || response.status === 401) {
+          // signed out, the full page load takes the user to the login form
+          window.location.reload();
+          return;
+        }
+        if (response.status === 404) {
+          swapRow(id, "");
+          return;
+        }
+        if (!response.ok) {
+          return; // keep the row as it is, the next event or reload fixes it
+        }
+        return response.text().then(function (html) {
+          swapRow(id, html);
+        });
+      });
+  }
+
+  rows.addEventListener("click", function (event) {
+    var link = event.target.closest("a[data-fragment]");
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    fetchRow(link.getAttribute("href"), link.closest("tr").id.slice(5));
+  });
+
+  if (!window.EventSource) {
+    return;
+  }
+  var source = new EventSource("/todos/events");
+
+  function refreshRow(message) {
+    var event = JSON.parse(message.data);
+    var row = rowFor(event.id);
+    // this tab already swapped in the row for its own actions
+    if (row && Number(row.getAttribute("data-revision")) >= event.revision) {
+      return;
+    }
+    fetchRow("/home/row/" + event.id, event.id);
+  }
+
+  source.addEventListener("created", refreshRow);
+  source.addEventListener("updated", refreshRow);
+  source.addEventListener("deleted", function (message) {
+    swapRow(JSON.parse(message.data).id, "");
+  });
+})();
@@ -0,0 +1,100 @@
+"""Per-user open/completed counters, updated in the same transaction as the todo.
+
+Reading them is a lookup of at most five rows per user instead of a
+COUNT(*) over todos. ``recompute`` rebuilds a user's rows from scratch.
+"""
+
+from sqlalchemy import delete, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import Todo, User, UserTodoStats
+
+
+def _bucket(priority, completed):
+    return int(priority or 0), bool(completed)
+
+
+def _add(db: Session, owner_id: int, priority: int, completed: bool, amount: int):
+    column = "completed_count" if completed else "open_count"
+    if db.get_bind().dialect.name == "postgresql":
+        insert = postgresql.insert
+    else:
+        insert = sqlite.insert
+    values = {"user_id": owner_id, "priority": priority}
+    values["open_count"] = values["completed_count"] = 0
+    values[column] = max(amount, 0)
+    statement = insert(UserTodoStats).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserTodoStats.user_id, UserTodoStats.priority],
+        set_={column: getattr(UserTodoStats, column) + amount},
+    )
+    db.execute(statement)
+
+
+def record_change(db: Session, todo: Todo):
+    """Move a created/updated todo between buckets, call before commit."""
+    state = inspect(todo)
+    new = _bucket(todo.priority, todo.completed)
+    if state.persistent:
+        old = _bucket(_old_value(state, "priority"), _old_value(state, "completed"))
+        record_move(db, todo.owner_id, old, new)
+    else:
+        _add(db, todo.owner_id, *new, 1)
+
+
+def record_move(db: Session, owner_id: int, old: tuple, new: tuple):
+    """Move one todo from the (priority, completed) bucket ``old`` to ``new``."""
+    old, new = _bucket(*old), _bucket(*new)
+    if old == new:
+        return
+    _add(db, owner_id, *old, -1)
+    _add(db, owner_id, *new, 1)
+
+
+def record_delete(db: Session, todo: Todo):
+    _add(db, todo.owner_id, *_bucket(todo.priority, todo.completed), -1)
+
+
+def _old_value(state, attribute: str):
+    history = state.attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.attrs[attribute].value
+
+
+def for_user(db: Session, owner_id: int):
+    rows = db.query(UserTodoStats).filter(UserTodoStats.user_id == owner_id).all()
+    return {
+        "open": sum(row.open_count for row in rows),
+        "completed": sum(row.completed_count for row in rows),
+        "by_priority": {
+            row.priority: {"open": row.open_count, "completed": row.completed_count}
+            for row in sorted(rows, key=lambda row: row.priority)
+        },
+    }
+
+
+def users_by_load(db: Session, limit: int):
+    open_todos = func.sum(UserTodoStats.open_count).label("open")
+    completed_todos = func.sum(UserTodoStats.completed_count).label("completed")
+    rows = db.execute(
+        select(User.id, User.email, open_todos, completed_todos)
+        .join(UserTodoStats, UserTodoStats.user_id == User.id)
+        .group_by(User.id, User.email)
+        .order_by(open_todos.desc(), User.id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in rows]
+
+
+def recompute(db: Session, owner_id: int):
+    """Rebuild one user's counters from todos, e.g. after manual data fixes."""
+    db.execute(delete(UserTodoStats).where(UserTodoStats.user_id == owner_id))
+    rows = db.execute(
+        select(Todo.priority, Todo.completed, func.count())
+        .where(Todo.owner_id == owner_id)
+        .group_by(Todo.priority, Todo.completed)
+    )
+    for priority, completed, count in rows:
+        _add(db, owner_id, *_bucket(priority, completed), count)
@@ -0,0 +1,63 @@
+"""Per-user revisions used by the delta sync endpoint (/todos/changes).
+
+``touch_todo`` and ``record_delete`` are called on every todo write path, so
+they also keep the stats counters in step and drop cached copies of the todo.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import cache, stats
+from .models import Todo, TodoTombstone, User
+
+
+def next_revision(db: Session, owner_id: int, count: int = 1) -> int:
+    """Reserve ``count`` revisions and return the last one."""
+    # a single UPDATE keeps the counter monotonic: on postgres the row lock is
+    # held until commit, so two concurrent writers can't get the same number
+    db.execute(
+        update(User)
+        .where(User.id == owner_id)
+        .values(todo_revision=User.todo_revision + count)
+    )
+    revision = db.scalar(select(User.todo_revision).where(User.id == owner_id))
+    return revision or 0
+
+
+def touch_todo(db: Session, todo: Todo):
+    """Stamp a created/updated todo, call before commit."""
+    stats.record_change(db, todo)
+    cache.invalidate_after_commit(db, todo.owner_id, todo.id)
+    todo.revision = next_revision(db, todo.owner_id)
+    todo.updated_at = datetime.utcnow()
+
+
+def record_delete(db: Session, todo: Todo):
+    """Leave a tombstone for a deleted todo, call before commit."""
+    stats.record_delete(db, todo)
+    cache.invalidate_after_commit(db, todo.owner_id, todo.id)
+    revision = next_revision(db, todo.owner_id)
+    db.add(TodoTombstone(todo_id=todo.id, owner_id=todo.owner_id, revision=revision))
+    return revision
+
+
+def changes_since(db: Session, owner_id: int, since: int):
+    revision = db.scalar(select(User.todo_revision).where(User.id == owner_id)) or 0
+    todos = db.query(Todo).filter(Todo.owner_id == owner_id)
+    if since > 0:
+        todos = todos.filter(Todo.revision > since)
+    # a full sync gets every live todo, whatever revision it carries
+    todos = todos.order_by(Todo.revision, Todo.id).all()
+    deleted = []
+    if since > 0:
+        # a client starting from 0 has nothing to delete
+        deleted = [
+            row.todo_id
+            for row in db.query(TodoTombstone.todo_id)
+            .filter(TodoTombstone.owner_id == owner_id)
+            .filter(TodoTombstone.revision > since)
+            .order_by(TodoTombstone.revision)
+        ]
+    return {"revision": revision, "todos": todos, "deleted": deleted}
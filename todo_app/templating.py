@@ -0,0 +1,13 @@
+"""The one Jinja2 environment shared by every router.
+
+Each router used to build its own, so every template was compiled up to three
+times and cached three times. ``warmup`` compiles them all at startup.
+"""
+
+import os
+
+from fastapi.templating import Jinja2Templates
+
+templates = Jinja2Templates(
+    directory=os.path.join(os.path.dirname(__file__), "templates")
+)
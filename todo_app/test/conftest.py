@@ -0,0 +1,127 @@
+"""Fixtures shared by the test modules.
+
+Every test gets its own in-memory SQLite database. Nothing is shared between
+tests, and there is nothing to clean up, so the suite runs in any order and
+in parallel with ``pytest -n auto`` (pytest-xdist).
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .. import idempotency, sharding
+from ..cache import todo_cache
+from ..main import app
+from ..models import Base, Todo, User
+from ..routers import admin, auth, todos, users
+from ..routers.auth import bcrypt_context
+
+# the fewest rounds bcrypt accepts, real hashes in tests needn't be slow
+bcrypt_context.update(bcrypt__rounds=4)
+
+
+def memory_engine():
+    # one connection shared by the app's threads, so they all see the same
+    # in-memory database, which goes away with it
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def engine():
+    engine = memory_engine()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def shard_engines():
+    """``shard_engines(names)`` returns a separate database per shard name."""
+    engines = []
+
+    def make(names):
+        made = {name: memory_engine() for name in names}
+        engines.extend(made.values())
+        return made
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def session_maker(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def current_user():
+    return {"username": "sanjeev", "user_id": 1}
+
+
+@pytest.fixture
+def client(engine, session_maker, current_user, monkeypatch):
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    for dependency in (
+        auth.get_db,
+        todos.get_db,
+        todos.get_read_db,
+        users.get_db,
+        users.get_read_db,
+        admin.get_db,
+        admin.get_read_db,
+    ):
+        app.dependency_overrides[dependency] = override_get_db
+    app.dependency_overrides[auth.get_current_user] = lambda: current_user
+    monkeypatch.setattr(idempotency.store, "session_factory", session_maker)
+    # admin listings and login go to the shards directly
+    monkeypatch.setattr(sharding, "shards", sharding.ShardSet({"primary": engine}))
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    todo_cache.clear()
+
+
+@pytest.fixture
+def test_user(session_maker, current_user):
+    user = User(
+        id=current_user["user_id"],
+        email="sanjeev@example.com",
+        first_name="sanjeev",
+        hashed_password=bcrypt_context.hash("password"),
+        role="admin",
+    )
+    db = session_maker()
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.close()
+    return user
+
+
+@pytest.fixture
+def test_add_todo(session_maker, current_user):
+    todo = Todo(
+        task="fast_api",
+        description="learn fast api",
+        priority=5,
+        owner_id=current_user["user_id"],
+    )
+    db = session_maker()
+    db.add(todo)
+    db.commit()
+    db.refresh(todo)
+    db.close()
+    return todo
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from ..archive import Archiver
+from ..models import Tag, Todo, TodoArchive, TodoTombstone, User
+from ..queries import archived_for_owner
+
+NOW = datetime(2026, 10, 19, 9, 0)
+
+
+def test_old_completed_todos_move_in_batches(session_maker):
+    db = session_maker()
+    db.add(User(id=1, email="sanjeev@example.com"))
+    tag = Tag(owner_id=1, name="work")
+    # (completed, days since the last change)
+    for todo_id, (completed, days) in enumerate(
+        [(True, 40), (True, 35), (False, 90), (True, 5), (True, 31)], start=1
+    ):
+        db.add(
+            Todo(
+                id=todo_id,
+                task=f"task {todo_id}",
+                owner_id=1,
+                completed=completed,
+                updated_at=NOW - timedelta(days=days),
+                tags=[tag] if todo_id == 1 else [],
+            )
+        )
+    db.commit()
+    db.close()
+
+    archiver = Archiver(session_maker, after=timedelta(days=30), batch_size=2, pause=0)
+    assert archiver.archive_all(NOW) == 3
+
+    db = session_maker()
+    assert [todo.id for todo in db.query(Todo).order_by(Todo.id)] == [3, 4]
+    assert db.query(TodoArchive).filter_by(todo_id=1).one().tags == ["work"]
+    assert db.query(TodoTombstone).count() == 3
+    first = archived_for_owner(db, 1, limit=2)
+    assert [todo["todo_id"] for todo in first] == [5, 2]
+    rest = archived_for_owner(db, 1, before=first[-1]["id"], limit=2)
+    assert [todo["todo_id"] for todo in rest] == [1]
+    db.close()
+
+
+def test_reused_todo_ids_and_undated_todos_are_archived(session_maker):
+    db = session_maker()
+    db.add(User(id=1, email="sanjeev@example.com"))
+    db.add(Todo(id=1, task="first", owner_id=1, completed=True))
+    db.commit()
+    # written before updated_at existed
+    db.execute(update(Todo).values(updated_at=None))
+    db.commit()
+    db.close()
+
+    archiver = Archiver(session_maker, after=timedelta(days=30), pause=0)
+    assert archiver.archive_all(NOW) == 0  # stamped, starts ageing now
+    assert archiver.archive_all(NOW + timedelta(days=31)) == 1
+
+    # sqlite hands the freed id to the next todo
+    db = session_maker()
+    todo = Todo(task="second", owner_id=1, completed=True, updated_at=NOW)
+    db.add(todo)
+    db.commit()
+    assert todo.id == 1
+    db.close()
+    assert archiver.archive_all(NOW + timedelta(days=90)) == 1
+
+    db = session_maker()
+    archived = archived_for_owner(db, 1)
+    assert [(todo["todo_id"], todo["task"]) for todo in archived] == [
+        (1, "second"),
+        (1, "first"),
+    ]
+    db.close()
@@ -0,0 +1,78 @@
+import itertools
+import time
+
+from sqlalchemy import event
+from starlette.requests import Request
+
+from .. import database
+from ..database import PRIMARY_COOKIE, ReplicaPool, engine, read_session
+from ..main import app
+from ..routers import todos
+from .conftest import memory_engine
+
+
+def make_request(cookie: str = ""):
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "headers": headers})
+
+
+def test_replica_pool_rotates_over_healthy_replicas(tmp_path):
+    pool = ReplicaPool(
+        [f"sqlite:///{tmp_path}/replica1.db", f"sqlite:///{tmp_path}/replica2.db"]
+    )
+    first, second = pool.engines
+    assert [pool.pick(), pool.pick(), pool.pick()] == [first, second, first]
+    pool.dispose()
+
+
+def test_replica_pool_skips_lagging_replica(tmp_path):
+    pool = ReplicaPool(
+        [f"sqlite:///{tmp_path}/replica1.db", f"sqlite:///{tmp_path}/replica2.db"]
+    )
+    first, second = pool.engines
+    pool._lag[first] = (time.monotonic(), 60.0)
+    assert [pool.pick(), pool.pick()] == [second, second]
+    pool._lag[second] = (time.monotonic(), None)
+    assert pool.pick() is None
+    pool.dispose()
+
+
+def test_read_session_sticks_to_primary_after_write(monkeypatch, tmp_path):
+    pool = ReplicaPool([f"sqlite:///{tmp_path}/replica1.db"])
+    monkeypatch.setattr(database, "replicas", pool)
+
+    db = read_session(make_request())
+    assert db.get_bind() is pool.engines[0]
+    db.close()
+
+    cookie = f"{PRIMARY_COOKIE}={time.time() + 10}"
+    db = read_session(make_request(cookie))
+    assert db.get_bind() is engine
+    db.close()
+    pool.dispose()
+
+
+def test_write_pins_the_client_to_the_primary(
+    client, session_maker, test_user, monkeypatch
+):
+    # the primary is the test database, the replica an empty copy of the schema
+    replica = memory_engine()
+    pool = ReplicaPool([])
+    pool.engines = [replica]
+    pool._rotation = itertools.cycle(pool.engines)
+    monkeypatch.setattr(database, "replicas", pool)
+    monkeypatch.setattr(database, "SessionLocal", session_maker)
+    event.listen(session_maker, "after_commit", database.remember_write)
+    del app.dependency_overrides[todos.get_read_db]
+    try:
+        payload = {"task": "fast_api", "description": "learn", "priority": 3}
+        response = client.post("/todo/create_todo", json=payload)
+        assert PRIMARY_COOKIE in response.cookies
+        # the client sends the cookie back and reads its own write
+        assert [todo["task"] for todo in client.get("/").json()] == ["fast_api"]
+
+        client.cookies.clear()
+        assert client.get("/").json() == []
+    finally:
+        event.remove(session_maker, "after_commit", database.remember_write)
+        replica.dispose()
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+from .. import events
+
+
+class DroppedConnection:
+    def cursor(self):
+        raise OSError("server closed the connection unexpectedly")
+
+
+def test_failed_notify_is_logged_not_raised(caplog):
+    fanout = events.PostgresFanout.__new__(events.PostgresFanout)
+    fanout.channel = events.PG_CHANNEL
+    fanout._send = DroppedConnection()
+    fanout._send_lock = threading.Lock()
+    fanout._sending = set()
+
+    async def publish():
+        # returns before the NOTIFY runs, off the event loop
+        fanout.notify(1, {"type": "updated", "id": 1, "revision": 2})
+        assert fanout._sending
+        await asyncio.gather(*fanout._sending)
+
+    asyncio.run(publish())
+    fanout.notify(1, {"type": "deleted", "id": 1, "revision": 3})  # from a thread
+    assert caplog.text.count("relaying an event to other workers failed") == 2
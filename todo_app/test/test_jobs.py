@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from .. import jobs
+from ..models import OutboxJob
+
+
+def test_enqueued_jobs_run_after_commit(session_maker, monkeypatch):
+    seen = []
+    monkeypatch.setitem(
+        jobs.handlers, "record", lambda db, payload: seen.append(payload)
+    )
+
+    db = session_maker()
+    jobs.enqueue(db, "record", user_id=1)
+    db.rollback()
+    jobs.enqueue(db, "record", user_id=2)
+    db.commit()
+    db.close()
+
+    worker = jobs.JobWorker(session_maker)
+    assert worker.run_pending() == 1
+    assert seen == [{"user_id": 2}]
+    db = session_maker()
+    assert db.query(OutboxJob.status).scalar() == "done"
+    db.close()
+
+
+def test_failed_job_is_retried_later_then_given_up(session_maker, monkeypatch):
+
+    def fail(db, payload):
+        raise RuntimeError("smtp down")
+
+    monkeypatch.setitem(jobs.handlers, "fail", fail)
+    db = session_maker()
+    jobs.enqueue(db, "fail")
+    db.commit()
+    db.close()
+
+    worker = jobs.JobWorker(session_maker, max_attempts=2)
+    assert worker.run_pending() == 1
+    db = session_maker()
+    job = db.query(OutboxJob).one()
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert "smtp down" in job.last_error
+
+    # due again only after the backoff
+    assert worker.run_pending() == 0
+    job.run_after = job.created_at
+    db.commit()
+    assert worker.run_pending() == 1
+    db.refresh(job)
+    assert (job.status, job.attempts) == ("failed", 2)
+    db.close()
+
+
+def test_worker_keeps_running_after_a_failed_claim(session_maker, monkeypatch):
+    seen = []
+    monkeypatch.setitem(
+        jobs.handlers, "record", lambda db, payload: seen.append(payload)
+    )
+    monkeypatch.setattr(jobs, "retry_delay", lambda failures: 0)
+    db = session_maker()
+    jobs.enqueue(db, "record", user_id=1)
+    db.commit()
+    db.close()
+
+    worker = jobs.JobWorker(session_maker, poll_interval=0.01)
+    claim = worker.claim
+    calls = []
+
+    def flaky_claim(limit):
+        calls.append(limit)
+        if len(calls) == 1:
+            raise RuntimeError("connection reset")
+        return claim(limit)
+
+    monkeypatch.setattr(worker, "claim", flaky_claim)
+
+    async def run_until_done():
+        task = asyncio.create_task(worker.run())
+        while not seen:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(asyncio.wait_for(run_until_done(), 5))
+    assert seen == [{"user_id": 1}]
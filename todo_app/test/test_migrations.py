@@ -0,0 +1,86 @@
+import io
+import logging
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+
+from ..migrations import backfill, create_index_concurrently
+from ..models import Todo, User
+
+
+@contextmanager
+def operations(connection=None, dialect_name=None, **opts):
+    # what run_migrations sets up around each migration script
+    context = MigrationContext.configure(
+        connection, dialect_name=dialect_name, opts=opts
+    )
+    with Operations.context(context), context.begin_transaction(_per_migration=True):
+        yield context
+
+
+def add_todos(session_maker, count: int):
+    db = session_maker()
+    db.add(User(id=1, email="sanjeev@example.com"))
+    db.add_all(
+        Todo(task=f"task {number}", priority=number % 2 + 1, owner_id=1)
+        for number in range(count)
+    )
+    db.commit()
+    db.close()
+
+
+def descriptions(engine) -> list:
+    with engine.connect() as connection:
+        return connection.scalars(sa.select(Todo.description).order_by(Todo.id)).all()
+
+
+def test_backfill_commits_in_id_ranges(engine, session_maker):
+    add_todos(session_maker, 25)
+    updates = []
+    sa.event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: (
+            updates.append(statement) if statement.startswith("UPDATE") else None
+        ),
+    )
+    with engine.connect() as connection, operations(connection):
+        updated = backfill(
+            "todos",
+            {"description": "'batched'"},
+            where="priority = 1",
+            batch_size=10,
+            pause=0,
+        )
+    assert updated == 13
+    assert len(updates) == 3
+    assert descriptions(engine) == [
+        "batched" if number % 2 == 0 else None for number in range(25)
+    ]
+
+
+def test_dry_run_changes_nothing(engine, session_maker, caplog):
+    caplog.set_level(logging.INFO, logger="alembic.online")
+    add_todos(session_maker, 5)
+    with engine.connect() as connection, operations(
+        connection, as_sql=True, dry_run=True, dry_run_connection=connection
+    ):
+        assert backfill("todos", {"description": "'x'"}, pause=0) == 0
+        create_index_concurrently("ix_todos_task", "todos", ["task"])
+    assert descriptions(engine) == [None] * 5
+    assert "ix_todos_task" not in {
+        index["name"] for index in sa.inspect(engine).get_indexes("todos")
+    }
+    assert "would update ~5 rows of todos" in caplog.text
+    assert "would index ~5 rows of todos as ix_todos_task" in caplog.text
+
+
+def test_offline_index_build_never_drops_a_valid_index():
+    output = io.StringIO()
+    with operations(dialect_name="postgresql", as_sql=True, output_buffer=output):
+        create_index_concurrently("ix_todos_task", "todos", ["task"])
+    sql = output.getvalue()
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_task" in sql
+    assert "DROP INDEX" not in sql
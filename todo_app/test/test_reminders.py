@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from .. import events, sync
+from ..models import OutboxJob, Todo, User
+from ..reminders import ReminderScheduler
+
+NOW = datetime(2026, 10, 19, 9, 0)
+
+
+def add_reminders(session_maker, remind_in_minutes):
+    db = session_maker()
+    db.add(User(id=1, email="sanjeev@example.com"))
+    for todo_id, minutes in enumerate(remind_in_minutes, start=1):
+        remind_at = NOW + timedelta(minutes=minutes) if minutes is not None else None
+        db.add(
+            Todo(id=todo_id, task=f"task {todo_id}", owner_id=1, remind_at=remind_at)
+        )
+    db.commit()
+    db.close()
+
+
+def sent_reminders(session_maker):
+    db = session_maker()
+    sent = [
+        job.payload["todo_id"] for job in db.query(OutboxJob).order_by(OutboxJob.id)
+    ]
+    db.close()
+    return sent
+
+
+def test_only_reminders_inside_the_window_are_loaded(session_maker):
+    add_reminders(session_maker, [-1, 2, None, 30])
+    scheduler = ReminderScheduler(session_maker, lookahead=timedelta(minutes=5))
+    assert scheduler.refill(NOW) == 2
+    assert scheduler.dispatch_due(NOW) == 1
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=2)) == 1
+    assert sent_reminders(session_maker) == [1, 2]
+
+    db = session_maker()
+    assert db.query(Todo).filter(Todo.remind_at.isnot(None)).count() == 1
+    db.close()
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=30)) == 0
+
+
+def test_heap_stays_bounded_and_catches_up(session_maker):
+    add_reminders(session_maker, [-5, -4, -3, -2, -1])
+    scheduler = ReminderScheduler(session_maker, max_heap=2)
+    sent = 0
+    while scheduler.refill(NOW):
+        assert len(scheduler._heap) <= 2
+        sent += scheduler.dispatch_due(NOW)
+    assert sent == 5
+    assert sent_reminders(session_maker) == [1, 2, 3, 4, 5]
+
+
+def test_moved_reminder_is_not_sent_at_the_old_time(session_maker):
+    add_reminders(session_maker, [1])
+    scheduler = ReminderScheduler(session_maker)
+    scheduler.refill(NOW)
+
+    db = session_maker()
+    todo = db.get(Todo, 1)
+    todo.remind_at = NOW + timedelta(minutes=3)
+    db.commit()
+    scheduler.schedule(todo)
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=1)) == 0
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=3)) == 1
+    db.close()
+
+
+def test_sent_reminder_is_a_synced_change(session_maker, monkeypatch):
+    add_reminders(session_maker, [1])
+    published = []
+    monkeypatch.setattr(
+        events, "publish_todo_data", lambda kind, row: published.append(row)
+    )
+    scheduler = ReminderScheduler(session_maker)
+    scheduler.refill(NOW)
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=1)) == 1
+
+    db = session_maker()
+    changes = sync.changes_since(db, 1, 0)
+    db.close()
+    assert changes["revision"] == 1
+    assert [(t.id, t.revision, t.remind_at) for t in changes["todos"]] == [(1, 1, None)]
+    assert changes["todos"][0].updated_at is not None
+    assert [(row["id"], row["revision"]) for row in published] == [(1, 1)]
+
+
+def test_failed_dispatch_is_retried(session_maker):
+    add_reminders(session_maker, [1])
+    scheduler = ReminderScheduler(session_maker)
+    scheduler.refill(NOW)
+
+    def broken():
+        raise OperationalError("UPDATE todos", {}, Exception("database is locked"))
+
+    scheduler.session_factory = broken
+    with pytest.raises(OperationalError):
+        scheduler.dispatch_due(NOW + timedelta(minutes=1))
+    scheduler.session_factory = session_maker
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=1)) == 1
+    assert sent_reminders(session_maker) == [1]
+
+
+def test_stale_reminder_takes_no_revision(session_maker):
+    add_reminders(session_maker, [1])
+    scheduler = ReminderScheduler(session_maker)
+    scheduler.refill(NOW)
+    db = session_maker()
+    # sent by another worker in the meantime
+    db.get(Todo, 1).remind_at = None
+    db.commit()
+
+    assert scheduler.dispatch_due(NOW + timedelta(minutes=1)) == 0
+    assert db.get(User, 1).todo_revision == 0
+    db.close()
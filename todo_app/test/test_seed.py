@@ -0,0 +1,21 @@
+from sqlalchemy import func, select
+
+from ..benchmarks.seed import generate
+from ..models import Todo, User, UserDirectory
+
+
+def test_seeded_rows_satisfy_foreign_keys(engine):
+    # postgres always checks them, sqlite only when asked
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    generate(engine, users=20, todos=300, batch=50)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(UserDirectory)) == 20
+        last_revisions = dict(
+            connection.execute(
+                select(Todo.owner_id, func.max(Todo.revision)).group_by(Todo.owner_id)
+            ).all()
+        )
+        counters = dict(connection.execute(select(User.id, User.todo_revision)).all())
+    assert counters == {user_id: last_revisions.get(user_id, 0) for user_id in counters}
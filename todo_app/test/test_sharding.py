@@ -0,0 +1,100 @@
+import asyncio
+
+from sqlalchemy.orm import sessionmaker
+
+from .. import jobs, queries, sync
+from ..models import OutboxJob, Tag, Todo, TodoArchive, TodoTombstone, User
+from ..rebalance import rebalance
+from ..sharding import HashRing, ShardSet, merge_pages
+
+
+def test_adding_a_shard_moves_only_its_share():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    owners = range(1, 10001)
+    placed = [before.node_for(owner) for owner in owners]
+    assert all(placed.count(name) > 2000 for name in "abc")
+    moved = [
+        owner for owner in owners if before.node_for(owner) != after.node_for(owner)
+    ]
+    assert all(after.node_for(owner) == "d" for owner in moved)
+    assert 1500 < len(moved) < 3500
+
+
+def test_fan_out_pages_merge_in_id_order(shard_engines):
+    shards = ShardSet(shard_engines(["a", "b"]))
+    for user_id in range(1, 21):
+        with shards.session_for(user_id) as db:
+            db.add(User(id=user_id, email=f"user{user_id}@example.com"))
+            db.commit()
+
+    def page(after_id):
+        pages = asyncio.run(
+            shards.fan_out(lambda db: queries.all_users(db, after_id, limit=7))
+        )
+        return [row["id"] for row in merge_pages(pages, lambda row: row["id"], 7)]
+
+    assert page(0) == list(range(1, 8))
+    assert page(7) == list(range(8, 15))
+    assert page(14) == list(range(15, 21))
+
+
+def test_rebalance_moves_users_with_their_todos(shard_engines):
+    engines = shard_engines(["a", "b", "c"])
+    old = ShardSet({name: engines[name] for name in ("a", "b")})
+    old_ids = {}
+    for user_id in range(1, 31):
+        with old.session_for(user_id) as db:
+            db.add(User(id=user_id, email=f"user{user_id}@example.com"))
+            db.commit()
+            tag = Tag(owner_id=user_id, name="work")
+            todos = [
+                Todo(task=f"{user_id}-{number}", owner_id=user_id, tags=[tag])
+                for number in range(3)
+            ]
+            for todo in todos:
+                db.add(todo)
+                sync.touch_todo(db, todo)
+            db.add(
+                TodoArchive(todo_id=user_id, owner_id=user_id, task=f"{user_id}-done")
+            )
+            jobs.enqueue(db, "recompute_stats", user_id=user_id)
+            db.commit()
+            old_ids[user_id] = [todo.id for todo in todos]
+
+    new = ShardSet(engines)
+    assert rebalance(new, dry_run=True)
+    moved = rebalance(new)
+    assert set(target for _, target in moved) == {"c"}
+    assert not rebalance(new)
+
+    for user_id in range(1, 31):
+        session_maker = sessionmaker(bind=new.engine_for(user_id))
+        with session_maker() as db:
+            todos = db.query(Todo).filter(Todo.owner_id == user_id).all()
+            assert sorted(todo.task for todo in todos) == [
+                f"{user_id}-{number}" for number in range(3)
+            ]
+            assert all([tag.name for tag in todo.tags] == ["work"] for todo in todos)
+            archived = queries.archived_for_owner(db, user_id)
+            assert [todo["task"] for todo in archived] == [f"{user_id}-done"]
+            assert [job.payload for job in db.query(OutboxJob)].count(
+                {"user_id": user_id}
+            ) == 1
+            changes = sync.changes_since(db, user_id, 3)
+            if new.name_for(user_id) == "c":
+                # clients that synced before the move swap ids
+                new_ids = [todo.id for todo in changes["todos"]]
+                assert len(new_ids) == 3
+                assert changes["deleted"] == [
+                    todo_id for todo_id in old_ids[user_id] if todo_id not in new_ids
+                ]
+            else:
+                assert changes == {"revision": 3, "todos": [], "deleted": []}
+        for name, engine in engines.items():
+            if name != new.name_for(user_id):
+                with sessionmaker(bind=engine)() as db:
+                    assert db.get(User, user_id) is None
+                    assert not db.query(TodoTombstone).filter_by(owner_id=user_id).all()
+                    payloads = [job.payload for job in db.query(OutboxJob)]
+                    assert {"user_id": user_id} not in payloads
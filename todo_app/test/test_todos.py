@@ -1,58 +1,15 @@
-import pytest
-from fastapi.testclient import TestClient
-from fastapi import status
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-from ..main import app
-from ..routers.todos import get_db, get_current_user
-from ..models import Base
-from ..models import Todo
-
-client = TestClient(app)
-
-SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
-
-TestingSessionMaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-
-def override_get_db():
-    db = TestingSessionMaker()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-def override_get_current_user():
-    return {"usernmae": "sanjeev", "user_id": 1}
-
-
-app.dependency_overrides[get_db] = override_get_db
-app.dependency_overrides[get_current_user] = override_get_current_user
+from datetime import timedelta
 
+from fastapi import status
+from sqlalchemy import create_engine, event
 
-@pytest.fixture
-def test_add_todo():
-    todo = Todo(task="fast_api", description="learn fast api", priority=5, owner_id=1)
-    db = TestingSessionMaker()
-    db.add(todo)
-    db.commit()
-    yield todo
-    with engine.connect() as connection:
-        connection.execute(text("DELETE FROM todos;"))
-        connection.commit()
+from .. import database, health, sharding
+from ..cache import TodoCache, todo_cache
+from ..routers.auth import create_access_token
+from ..queries import owned_todo, todos_for_owner, user_by_id
 
 
-def test_read_all_authenticated(test_add_todo):
+def test_read_all_authenticated(client, test_add_todo):
     response = client.get("/")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == [
@@ -63,11 +20,16 @@ def test_read_all_authenticated(test_add_todo):
             "task": "fast_api",
             "owner_id": 1,
             "id": 1,
+            "revision": 0,
+            "updated_at": test_add_todo.updated_at.isoformat(),
+            "due_at": None,
+            "remind_at": None,
+            "tags": [],
         }
     ]
 
 
-def test_read_by_id_authenticated(test_add_todo):
+def test_read_by_id_authenticated(client, test_add_todo):
     response = client.get("/todo/1")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {
@@ -77,4 +39,298 @@ def test_read_by_id_authenticated(test_add_todo):
         "task": "fast_api",
         "owner_id": 1,
         "id": 1,
+        "revision": 0,
+        "updated_at": test_add_todo.updated_at.isoformat(),
+        "due_at": None,
+        "remind_at": None,
+        "tags": [],
     }
+
+
+def test_read_changes_since_revision(client, test_user):
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    client.post("/todo/create_todo", json=payload)
+    client.post("/todo/create_todo", json=payload)
+    response = client.get("/todos/changes")
+    assert response.json()["revision"] == 2
+    assert [todo["revision"] for todo in response.json()["todos"]] == [1, 2]
+
+    first_id = response.json()["todos"][0]["id"]
+    client.delete(f"/todo/delete_todo/{first_id}")
+    response = client.get("/todos/changes", params={"since": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"revision": 3, "todos": [], "deleted": [first_id]}
+
+
+def test_full_sync_includes_todos_from_before_revisions(client, test_add_todo):
+    # written before revisions existed, so it still carries revision 0
+    response = client.get("/todos/changes")
+    assert [todo["id"] for todo in response.json()["todos"]] == [test_add_todo.id]
+
+
+def test_websocket_receives_todo_events(client, test_user):
+    token = create_access_token("sanjeev", 1, timedelta(minutes=5))
+    client.cookies.set("access_token", token)
+    try:
+        with client.websocket_connect("/todos/ws") as websocket:
+            payload = {"task": "fast_api", "description": "learn", "priority": 3}
+            client.post("/todo/create_todo", json=payload)
+            event = websocket.receive_json()
+            assert event["type"] == "created"
+            assert event == {"type": "created", "id": event["id"], "revision": 1}
+
+            client.delete(f"/todo/delete_todo/{event['id']}")
+            event = websocket.receive_json()
+            assert event["type"] == "deleted"
+            assert event["revision"] == 2
+    finally:
+        client.cookies.clear()
+
+
+def test_complete_returns_row_fragment(client, test_user):
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    client.post("/todo/create_todo", json=payload)
+    todo_id = client.get("/todos/changes").json()["todos"][0]["id"]
+    token = create_access_token("sanjeev", 1, timedelta(minutes=5))
+    client.cookies.set("access_token", token)
+    try:
+        response = client.get(
+            f"/complete/{todo_id}",
+            headers={"HX-Request": "true"},
+            follow_redirects=False,
+        )
+    finally:
+        client.cookies.clear()
+    assert response.status_code == status.HTTP_200_OK
+    assert response.text.strip().startswith(f'<tr class="pointer" id="todo-{todo_id}"')
+    assert "strike-through-td" in response.text
+    assert "<html" not in response.text
+
+
+def test_stats_follow_every_write(client, test_user):
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    client.post("/todo/create_todo", json=payload)
+    client.post("/todo/create_todo", json={**payload, "priority": 5})
+    first, second = client.get("/todos/changes").json()["todos"]
+    client.put(f"/todo/update_todo/{first['id']}", json={**payload, "completed": True})
+    client.delete(f"/todo/delete_todo/{second['id']}")
+
+    response = client.get("/admin/users_by_load")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"id": 1, "email": "sanjeev@example.com", "open": 0, "completed": 1}
+    ]
+
+
+def test_read_by_id_is_cached_until_updated(client, test_user):
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    client.post("/todo/create_todo", json=payload)
+    todo_id = client.get("/todos/changes").json()["todos"][0]["id"]
+    misses = todo_cache.misses
+
+    assert client.get(f"/todo/{todo_id}").json()["task"] == "fast_api"
+    assert client.get(f"/todo/{todo_id}").json()["task"] == "fast_api"
+    assert todo_cache.misses == misses + 1
+
+    client.put(f"/todo/update_todo/{todo_id}", json={**payload, "task": "sqlalchemy"})
+    assert client.get(f"/todo/{todo_id}").json()["task"] == "sqlalchemy"
+    assert todo_cache.misses == misses + 2
+
+    client.delete(f"/todo/delete_todo/{todo_id}")
+    assert client.get(f"/todo/{todo_id}").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_cache_skips_rows_loaded_across_an_invalidation():
+    cache = TodoCache()
+
+    def load_then_write():
+        row = {"id": 1, "task": "old"}
+        # a writer commits while this read is still in flight
+        cache.invalidate(1, 1)
+        return row
+
+    assert cache.get(1, 1, load_then_write) == {"id": 1, "task": "old"}
+    assert cache.get(1, 1, lambda: {"id": 1, "task": "new"})["task"] == "new"
+    assert cache.get(1, 1, lambda: None)["task"] == "new"
+
+    # replica reads are served but not kept
+    cache.get(1, 2, lambda: {"id": 2}, fill=False)
+    assert cache.get(1, 2, lambda: None) is None
+
+
+def test_admin_all_users_never_returns_password_hash(client, test_user):
+    response = client.get("/admin/all_users")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {
+            "id": 1,
+            "email": "sanjeev@example.com",
+            "first_name": "sanjeev",
+            "last_name": None,
+            "is_active": True,
+            "role": "admin",
+        }
+    ]
+
+
+def test_admin_listings_read_the_replica_with_one_shard(client, test_user, monkeypatch):
+    async def fan_out(query):
+        raise AssertionError("a single shard is read through get_read_db")
+
+    monkeypatch.setattr(sharding.shards, "fan_out", fan_out)
+    for path in ("/admin/all_users", "/admin/all_todos", "/admin/users_by_load"):
+        assert client.get(path).status_code == status.HTTP_200_OK
+
+
+def test_tagged_todos_filter_and_load_in_two_queries(
+    client, session_maker, engine, test_user
+):
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    for _ in range(4):
+        client.post("/todo/create_todo", json=payload)
+    ids = [todo["id"] for todo in client.get("/todos/changes").json()["todos"]]
+    client.put(f"/todo/{ids[0]}/tags", json={"tags": ["work", "urgent"]})
+    client.put(f"/todo/{ids[1]}/tags", json={"tags": ["Work"]})
+    client.put(f"/todo/{ids[2]}/tags", json={"tags": ["home"]})
+    assert client.get(f"/todo/{ids[0]}").json()["tags"] == ["urgent", "work"]
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = session_maker()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        todos = todos_for_owner(db, 1, tags=["work", "home"])
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        db.close()
+    assert len(statements) == 2
+    assert [(todo["id"], todo["tags"]) for todo in todos] == [
+        (ids[0], ["urgent", "work"]),
+        (ids[1], ["work"]),
+        (ids[2], ["home"]),
+    ]
+
+    response = client.get("/", params={"tags": ["work", "urgent"], "match": "all"})
+    assert [todo["id"] for todo in response.json()] == [ids[0]]
+    response = client.get("/", params={"tags": "home"})
+    assert [(todo["id"], todo["tags"]) for todo in response.json()] == [
+        (ids[2], ["home"])
+    ]
+    # matched the way tags are stored, whatever the case or repeats
+    response = client.get("/", params={"tags": [" Work", "WORK"], "match": "all"})
+    assert [todo["id"] for todo in response.json()] == [ids[0], ids[1]]
+    response = client.get("/", params={"tags": ["Work", "urgent"], "match": "all"})
+    assert [todo["id"] for todo in response.json()] == [ids[0]]
+
+
+def test_browser_opening_root_goes_home(client, test_user):
+    response = client.get("/", headers={"Accept": "text/html"}, follow_redirects=False)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.headers["location"] == "/home"
+
+
+def test_cached_lookups_bind_each_calls_ids(session_maker, test_user, test_add_todo):
+    db = session_maker()
+    # the lambda statements are built once, the ids must still be this call's
+    assert owned_todo(db, 1, test_add_todo.id).task == "fast_api"
+    assert owned_todo(db, 2, test_add_todo.id) is None
+    assert owned_todo(db, 1, test_add_todo.id + 1) is None
+    assert owned_todo(db, 1, test_add_todo.id, with_tags=True).tags == []
+    assert user_by_id(db, 1).email == "sanjeev@example.com"
+    assert user_by_id(db, 2) is None
+    db.close()
+
+
+def test_create_with_idempotency_key_runs_once(client, test_user):
+    # the middleware reads the session cookie itself
+    token = create_access_token(
+        test_user.first_name, test_user.id, timedelta(minutes=5)
+    )
+    client.cookies.set("access_token", token)
+    payload = {"task": "fast_api", "description": "learn", "priority": 3}
+    headers = {"Idempotency-Key": "create-1"}
+    first = client.post("/todo/create_todo", json=payload, headers=headers)
+    retry = client.post("/todo/create_todo", json=payload, headers=headers)
+    assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(client.get("/todos/changes").json()["todos"]) == 1
+
+    reused = client.post(
+        "/todo/create_todo", json={**payload, "priority": 5}, headers=headers
+    )
+    assert reused.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    client.post("/todo/create_todo", json=payload, headers={"Idempotency-Key": "2"})
+    assert len(client.get("/todos/changes").json()["todos"]) == 2
+
+
+def test_liveness_and_readiness_before_startup(client):
+    assert client.get("/healthz").status_code == status.HTTP_200_OK
+    # the lifespan hasn't run, so the worker isn't ready for traffic
+    assert client.get("/readyz").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_readiness_checks_every_shard_and_replica(client, engine, monkeypatch):
+    monkeypatch.setattr(health, "ready", True)
+    monkeypatch.setattr(database, "engine", engine)
+    assert client.get("/readyz").json() == {"status": "ready"}
+
+    # a replica that can't be reached only degrades the worker
+    pool = database.ReplicaPool(["sqlite:////nonexistent/replica.db"])
+    monkeypatch.setattr(database, "replicas", pool)
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"status": "degraded", "replicas_unavailable": 1}
+
+    # a shard that can't be reached holds writes the worker can't serve
+    down = create_engine("sqlite:////nonexistent/shard.db")
+    shards = sharding.ShardSet({"a": engine, "b": down})
+    monkeypatch.setattr(sharding, "shards", shards)
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["unavailable"] == ["shard b"]
+    pool.dispose()
+    down.dispose()
+
+
+def test_anonymous_idempotency_keys_are_not_shared(client):
+    def register(email):
+        payload = {
+            "email": email,
+            "first_name": "newbie",
+            "last_name": "user",
+            "password": "password",
+            "role": "user",
+        }
+        headers = {"Idempotency-Key": "signup"}
+        return client.post("/auth/create_user", json=payload, headers=headers)
+
+    first = register("first@example.com")
+    other = register("second@example.com")
+    retry = register("first@example.com")
+    assert first.status_code == other.status_code == status.HTTP_201_CREATED
+    assert "Idempotent-Replayed" not in other.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+def test_fragment_requests_get_status_codes_not_redirects(client, test_user):
+    fragment = {"HX-Request": "true"}
+    response = client.get("/complete/1", headers=fragment, follow_redirects=False)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.text == ""
+
+    token = create_access_token("sanjeev", 1, timedelta(minutes=5))
+    client.cookies.set("access_token", token)
+    try:
+        for path in ("/complete/99", "/delete/99"):
+            response = client.get(path, headers=fragment, follow_redirects=False)
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+            assert response.text == ""
+        # a page load still goes back home
+        response = client.get("/complete/99", follow_redirects=False)
+        assert response.status_code == status.HTTP_302_FOUND
+    finally:
+        client.cookies.clear()
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from .. import main, sharding, writebehind
+from ..models import Todo, User, UserTodoStats
+from ..writebehind import WriteBehindBuffer
+
+
+@pytest.fixture
+def session_maker(session_maker):
+    db = session_maker()
+    db.add(User(id=1, email="sanjeev@example.com"))
+    db.add(Todo(id=1, task="fast_api", priority=3, completed=False, owner_id=1))
+    db.add(Todo(id=2, task="alembic", priority=3, completed=False, owner_id=1))
+    db.add(UserTodoStats(user_id=1, priority=3, open_count=2, completed_count=0))
+    db.commit()
+    db.close()
+    return session_maker
+
+
+def test_repeated_flips_collapse(session_maker):
+    buffer = WriteBehindBuffer(session_maker)
+    assert buffer.toggle_completed(1, 1, False) is True
+    assert buffer.toggle_completed(1, 1, False) is False
+    assert buffer.pending_for(1) == {}
+    assert buffer.flush() == 0
+
+
+def test_flush_writes_all_pending_in_one_transaction(session_maker):
+    buffer = WriteBehindBuffer(session_maker)
+    for _ in range(3):
+        buffer.toggle_completed(1, 1, False)
+    buffer.toggle_completed(1, 2, False)
+    assert buffer.pending_for(1) == {1: {"completed": True}, 2: {"completed": True}}
+
+    assert buffer.flush() == 2
+    assert buffer.flushes == 1
+    db = session_maker()
+    todos = db.query(Todo).order_by(Todo.id).all()
+    assert [(todo.completed, todo.revision) for todo in todos] == [(1, 1), (1, 2)]
+    assert db.get(User, 1).todo_revision == 2
+    todo_stats = db.get(UserTodoStats, (1, 3))
+    assert (todo_stats.open_count, todo_stats.completed_count) == (0, 2)
+    db.close()
+
+
+def test_click_during_flush_uses_inflight_value(session_maker):
+    buffer = WriteBehindBuffer(session_maker)
+    buffer.toggle_completed(1, 1, False)
+    buffer._inflight, buffer._pending = buffer._pending, {}
+    # the cache still says False until the flush commits
+    assert buffer.toggle_completed(1, 1, False) is False
+    assert buffer.pending_for(1) == {1: {"completed": False}}
+
+
+def test_clicks_buffered_by_two_workers_both_count(session_maker):
+    first = WriteBehindBuffer(session_maker)
+    second = WriteBehindBuffer(session_maker)
+    # each worker saw completed=False when its user clicked
+    assert first.toggle_completed(1, 1, False) is True
+    assert second.toggle_completed(1, 1, False) is True
+    assert first.flush() == 1
+    assert second.flush() == 1
+
+    db = session_maker()
+    todo = db.get(Todo, 1)
+    assert (todo.completed, todo.revision) == (False, 2)
+    db.close()
+
+
+def test_shutdown_releases_connections_after_a_failed_flush(
+    session_maker, engine, monkeypatch, caplog
+):
+    buffer = WriteBehindBuffer(session_maker)
+    buffer.toggle_completed(1, 1, False)
+
+    def database_down():
+        raise OperationalError("UPDATE todos", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(buffer, "flush", database_down)
+    monkeypatch.setattr(writebehind, "buffers", {"primary": buffer})
+    monkeypatch.setattr(sharding, "shards", sharding.ShardSet({"primary": engine}))
+    monkeypatch.setattr(main.warmup, "warm_up", lambda *engines: None)
+    disposed = []
+    monkeypatch.setattr(main.engine, "dispose", lambda: disposed.append("primary"))
+
+    async def serve_and_stop():
+        async with main.lifespan(main.app):
+            pass
+
+    asyncio.run(serve_and_stop())
+    assert disposed == ["primary"]
+    assert "final write-behind flush failed" in caplog.text
@@ -0,0 +1,70 @@
+"""Work done once at startup so the first requests don't pay for it.
+
+``warm_up`` runs in the lifespan before the app starts serving. It opens the
+connection pools, compiles every template into the shared environment, loads
+the bcrypt backend and imports what the routers import lazily. Each step is
+timed, and one that fails is logged and skipped, so a database that is still
+starting up slows the first requests down rather than stopping the worker.
+"""
+
+import logging
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def warm_pool(engine):
+    # check out a full pool at once so each connection is actually opened
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = [engine.connect() for _ in range(size)]
+    try:
+        for connection in connections:
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def compile_templates():
+    from .templating import templates
+
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
+
+
+def load_bcrypt():
+    from .routers.auth import bcrypt_context
+
+    # passlib picks and self-tests the bcrypt backend on first use
+    bcrypt_context.handler("bcrypt").get_backend()
+
+
+def import_deferred():
+    import jose.jwt  # noqa: F401
+
+
+def warm_up(*engines) -> dict:
+    """Run every step, return the seconds each one took."""
+    steps = {
+        # the primary and each shard, each engine once
+        "pool": lambda: [warm_pool(engine) for engine in dict.fromkeys(engines)],
+        "templates": compile_templates,
+        "bcrypt": load_bcrypt,
+        "imports": import_deferred,
+    }
+    timings = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("warm up step %s failed", name)
+        timings[name] = time.perf_counter() - started
+    logger.info(
+        "warmed up in %.3fs (%s)",
+        sum(timings.values()),
+        ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()),
+    )
+    return timings
@@ -0,0 +1,183 @@
+"""Optional write-behind buffer for completion toggles.
+
+With ``TODO_WRITE_BEHIND_WINDOW`` set to a number of seconds, /complete/{id}
+records the click here instead of committing. A click is kept as a flip, not
+as a value, and repeated flips of the same todo collapse (an even number
+cancels out). Every ``window`` seconds the remaining flips are applied to the
+rows as the database has them, in one transaction with a single executemany
+UPDATE, so clicks buffered by different workers all count. Reads overlay
+pending changes with ``apply_pending`` so a user always sees their own
+clicks.
+
+Each shard has its own buffer, see ``buffer_for``. Pending changes are
+flushed on shutdown from the app lifespan. A worker killed
+without a shutdown (SIGKILL, OOM) loses at most one window of toggles.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from . import cache, events, queries, sharding, stats, sync
+from .models import Todo
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, session_factory, window: float = 0.5):
+        self.session_factory = session_factory
+        self.window = window
+        self.flushes = 0
+        # (owner_id, todo_id) -> completed as this worker shows it, present
+        # while the todo has an odd number of unwritten flips
+        self._pending = {}
+        # what the running flush is writing, the base for clicks meanwhile
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+
+    def toggle_completed(self, owner_id: int, todo_id: int, committed: bool) -> bool:
+        """Flip completed, given its committed value, and return the new value."""
+        key = (owner_id, todo_id)
+        with self._lock:
+            shown = self._inflight.get(key, committed)
+            if key in self._pending:
+                # flipped back before it was written
+                del self._pending[key]
+                return shown
+            self._pending[key] = not shown
+            return not shown
+
+    def pending_for(self, owner_id: int) -> dict:
+        with self._lock:
+            pending = {}
+            for source in (self._inflight, self._pending):
+                for (owner, todo_id), completed in source.items():
+                    if owner == owner_id:
+                        pending[todo_id] = {"completed": completed}
+            return pending
+
+    def flush(self) -> int:
+        """Write every pending change in one transaction, return rows updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+            if not pending:
+                return 0
+            db = self.session_factory()
+            try:
+                written = self._write(db, pending)
+                db.commit()
+            except Exception:
+                db.rollback()
+                self._requeue(pending)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                db.close()
+            self.flushes += 1
+        if written:
+            db = self.session_factory()
+            try:
+                for row in queries.todos_by_ids(db, written):
+                    events.publish_todo_data("updated", row)
+            finally:
+                db.close()
+        return len(written)
+
+    def _write(self, db, pending: dict) -> list:
+        statement = select(Todo.id, Todo.owner_id, Todo.completed, Todo.priority)
+        statement = statement.where(Todo.id.in_([key[1] for key in pending]))
+        if db.get_bind().dialect.name == "postgresql":
+            statement = statement.with_for_update()
+        current = {row.id: row for row in db.execute(statement)}
+
+        by_owner = defaultdict(list)
+        for owner_id, todo_id in pending:
+            row = current.get(todo_id)
+            if row is None or row.owner_id != owner_id:
+                continue  # deleted or not theirs
+            # flip what is stored now, another worker may have flipped it too
+            by_owner[owner_id].append((row, {"completed": not row.completed}))
+
+        now = datetime.utcnow()
+        params = []
+        for owner_id, items in by_owner.items():
+            revision = sync.next_revision(db, owner_id, len(items)) - len(items)
+            for row, new in items:
+                revision += 1
+                stats.record_move(
+                    db,
+                    owner_id,
+                    (row.priority, row.completed),
+                    (row.priority, new["completed"]),
+                )
+                cache.invalidate_after_commit(db, owner_id, row.id)
+                params.append(
+                    {"id": row.id, "revision": revision, "updated_at": now, **new}
+                )
+        if params:
+            # orm bulk update by primary key, sent as one executemany
+            db.execute(update(Todo), params)
+        return [param["id"] for param in params]
+
+    def _requeue(self, pending: dict):
+        with self._lock:
+            for key, completed in pending.items():
+                if key in self._pending:
+                    # clicked again during the failed flush, the flips cancel
+                    del self._pending[key]
+                else:
+                    self._pending[key] = completed
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                # changes were requeued, try again next window
+                logger.exception("write-behind flush failed")
+
+
+def buffer_for(owner_id: int) -> Optional[WriteBehindBuffer]:
+    """The buffer for the owner's shard, None when write-behind is off."""
+    return buffers.get(sharding.shards.name_for(owner_id))
+
+
+def apply_pending(owner_id: int, todos):
+    """Overlay this user's buffered changes on rows read from the database."""
+    buffer = buffer_for(owner_id)
+    if buffer is None:
+        return todos
+    pending = buffer.pending_for(owner_id)
+    if not pending:
+        return todos
+    overlaid = []
+    for todo in todos:
+        todo = dict(getattr(todo, "_mapping", todo))
+        todo.update(pending.get(todo["id"], {}))
+        overlaid.append(todo)
+    return overlaid
+
+
+def _window() -> Optional[float]:
+    window = float(os.environ.get("TODO_WRITE_BEHIND_WINDOW", "0") or 0)
+    return window if window > 0 else None
+
+
+# shard name -> buffer
+buffers = {
+    name: WriteBehindBuffer(session_factory, _window())
+    for name, session_factory in sharding.shards.session_factories().items()
+    if _window()
+}